@@ -0,0 +1,266 @@
+"""
+Бенчмарк распознавания речи: real-time factor, задержка, память и пропускная способность.
+
+Генерирует синтетический корпус голосовых Ogg/Opus 48 кГц (как у Telegram) длиной от 1 с до 5 мин
+и прогоняет его через AudioProcessor.process_voice_message / stream_voice_message в нескольких
+конфигурациях конвейера. Каждая конфигурация запускается в отдельном процессе со своими
+переменными окружения (их читают и воркеры пула), поэтому пиковая память не смешивается.
+
+Для каждой конфигурации — две фазы:
+  * задержка: записи по одной, repeats раз; RTF = время обработки / длительность аудио;
+  * пропускная способность: весь корпус с concurrency задачами одновременно;
+    throughput_per_core — секунды аудио в секунду на одно ядро конфигурации.
+
+Результат — JSON (по строке на конфигурацию в stdout и общий файл --output).
+
+Запуск из корня проекта:
+    python -m benchmarks.asr_bench --configs inline pool segmented stream --vad 1 0
+    python -m benchmarks.asr_bench --durations 1 10 60 --corpus path/to/real/voices
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+# Конфигурации конвейера: переменные окружения процесса-замера
+CONFIGS = {
+    # Распознавание в потоке основного процесса, без пула
+    "inline": {"ASR_WORKERS": "0", "ASR_STREAMING": "0"},
+    # Пул процессов, каждая запись целиком в одном воркере
+    "pool": {"ASR_STREAMING": "0", "ASR_SEGMENT_MIN_SECONDS": "1e9"},
+    # Пул процессов, длинные записи делятся по паузам
+    "segmented": {"ASR_STREAMING": "0"},
+    # Потоковое распознавание в потоках с промежуточным текстом
+    "stream": {"ASR_STREAMING": "1"},
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def synthetic_voice(duration: float, samplerate: int = 48000, seed: int = 0) -> np.ndarray:
+    """Речеподобный сигнал: «слоги» с плавающим тоном и формантами, фразы, разделенные паузами, и фоновый шум"""
+    rng = np.random.default_rng(seed)
+    total = int(duration * samplerate)
+    signal = 0.003 * rng.standard_normal(total).astype(np.float32)
+    position = int(0.3 * samplerate)
+    while position < total:
+        phrase = int(rng.uniform(1.5, 4.0) * samplerate)
+        end = min(total, position + phrase)
+        t = np.arange(end - position) / samplerate
+        pitch = rng.uniform(110, 220) * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / samplerate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+        syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None) ** 0.5
+        signal[position:end] += (0.25 * syllables * voiced).astype(np.float32)
+        position = end + int(rng.uniform(0.2, 1.2) * samplerate)
+    return np.clip(signal, -1, 1)
+
+
+def encode_ogg_opus(signal: np.ndarray, samplerate: int = 48000) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, signal, samplerate, format="OGG", subtype="OPUS")
+    return buffer.getvalue()
+
+
+def build_corpus(durations: List[float], corpus_dir: Optional[str]) -> List[Dict]:
+    """Синтетические записи заданных длительностей плюс .ogg из corpus_dir, если указан"""
+    corpus = []
+    for index, duration in enumerate(durations):
+        corpus.append({
+            "name": f"synthetic_{duration:g}s",
+            "duration": duration,
+            "data": encode_ogg_opus(synthetic_voice(duration, seed=index)),
+        })
+    if corpus_dir:
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.endswith((".ogg", ".oga", ".opus")):
+                with open(os.path.join(corpus_dir, name), "rb") as f:
+                    data = f.read()
+                corpus.append({"name": name, "duration": sf.info(io.BytesIO(data)).duration, "data": data})
+    return corpus
+
+
+class LocalBot:
+    """Заменяет aiogram.Bot при скачивании: отдает байты записи из памяти"""
+
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+
+    async def get_file(self, file_id: str):
+        return type("File", (), {"file_path": file_id})()
+
+    async def download_file(self, file_path: str, destination):
+        destination.write(self.files[file_path])
+
+
+def peak_rss_mb(who: int) -> float:
+    # ru_maxrss в Linux — килобайты, в macOS — байты
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 1024 / 1024
+
+
+async def measure(corpus: List[Dict], repeats: int, concurrency: int) -> Dict:
+    """Выполняется в процессе-замере: настройки конфигурации уже в окружении"""
+    from aiogram.types import Voice
+    from core.services.audio import audio_processor
+
+    started = time.perf_counter()
+    await audio_processor.start()
+    startup_seconds = time.perf_counter() - started
+    if not audio_processor.is_model_ready():
+        raise RuntimeError("Модель Vosk не загрузилась — проверьте ASR_MODELS")
+
+    bot = LocalBot({item["name"]: item["data"] for item in corpus})
+
+    async def recognize(item: Dict) -> float:
+        voice = Voice(
+            file_id=item["name"], file_unique_id=item["name"],
+            duration=int(round(item["duration"])), file_size=len(item["data"]),
+        )
+        began = time.perf_counter()
+        if audio_processor.streaming:
+            async def ignore_partial(text: str):
+                pass
+            await audio_processor.stream_voice_message(voice, bot, ignore_partial)
+        else:
+            await audio_processor.process_voice_message(voice, bot)
+        return time.perf_counter() - began
+
+    # Первая задача поднимает распознаватели и страницы модели — в замер не идет
+    await recognize(corpus[0])
+
+    rows = []
+    latencies: List[float] = []
+    for item in corpus:
+        timings = [await recognize(item) for _ in range(repeats)]
+        latencies.extend(timings)
+        rows.append({
+            "name": item["name"],
+            "duration_s": round(item["duration"], 3),
+            "latency_p50_s": percentile(timings, 50),
+            "latency_min_s": min(timings),
+            "rtf": percentile(timings, 50) / item["duration"],
+        })
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(item: Dict) -> float:
+        async with semaphore:
+            return await recognize(item)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(limited(item) for item in corpus for _ in range(repeats)))
+    wall = time.perf_counter() - began
+    audio_seconds = sum(item["duration"] for item in corpus) * repeats
+    cores = max(1, min(audio_processor.workers, os.cpu_count() or 1))
+
+    if audio_processor.uses_process_pool():
+        # Дожидаемся воркеров, чтобы их пиковая память попала в RUSAGE_CHILDREN
+        audio_processor.get_executor().shutdown(wait=True)
+    audio_processor.shutdown()
+
+    total_audio = sum(row["duration_s"] * repeats for row in rows)
+    return {
+        "startup_s": startup_seconds,
+        "rtf": sum(latencies) / total_audio if total_audio else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "throughput_audio_s_per_s": audio_seconds / wall,
+        "throughput_per_core": audio_seconds / wall / cores,
+        "cores": cores,
+        "concurrency": concurrency,
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_worker_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "recognizer_stats": audio_processor.recognizer_stats(),
+        "vad_stats": audio_processor.vad_stats(),
+        "items": rows,
+    }
+
+
+def run_config(name: str, vad: str, workers: int, args) -> Dict:
+    """Запускает замер одной конфигурации в отдельном процессе и возвращает его JSON"""
+    env = dict(os.environ)
+    env.update({
+        "ASR_WORKERS": str(workers),
+        "ASR_VAD": vad,
+        # Синтетика — не речь: не даем потоковому режиму прерваться на «тишине»
+        "ASR_EMPTY_ABORT_SECONDS": "0",
+        "ASR_MAX_AUDIO_SECONDS": str(max(args.durations + [600])),
+        "LOG_LEVEL": "WARNING",
+        "LOG_CONSOLE": "0",
+        "LOG_DIR": args.log_dir,
+    })
+    env.update(CONFIGS[name])
+    command = [
+        sys.executable, "-m", "benchmarks.asr_bench", "--measure",
+        "--durations", *map(str, args.durations),
+        "--repeats", str(args.repeats),
+        "--concurrency", str(args.concurrency or int(env["ASR_WORKERS"]) or 1),
+    ]
+    if args.corpus:
+        command += ["--corpus", args.corpus]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        # Воркеры пишут в stderr JSON-логи; причина сбоя — последняя строка трассировки
+        lines = [line for line in completed.stderr.splitlines() if line.strip() and not line.startswith("{")]
+        return {"error": lines[-1] if lines else f"код выхода {completed.returncode}"}
+    # Последняя строка stdout — результат замера
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--vad", nargs="+", choices=["0", "1"], default=["1", "0"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 5, 15, 30, 60, 120, 300])
+    parser.add_argument("--corpus", help="каталог с реальными голосовыми .ogg в дополнение к синтетике")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=0, help="задач одновременно (по умолчанию — число воркеров)")
+    parser.add_argument("--output", default="asr_bench.json")
+    parser.add_argument("--log-dir", default="logs/bench")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        corpus = build_corpus(args.durations, args.corpus)
+        result = asyncio.run(measure(corpus, args.repeats, args.concurrency))
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    results = []
+    for name in args.configs:
+        for vad in args.vad:
+            workers = 0 if name == "inline" else args.workers
+            row = {"config": name, "vad": vad == "1", "workers": workers}
+            row.update(run_config(name, vad, workers, args))
+            results.append(row)
+            print(json.dumps({key: value for key, value in row.items() if key != "items"}, ensure_ascii=False))
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "durations": args.durations,
+        "repeats": args.repeats,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,446 @@
+"""
+Нагрузочный тест диалога: синтетические апдейты через настоящий Dispatcher и роутеры бота.
+
+N пользователей одновременно проходят ClientDialog (имя → телефон → детали → подтверждение →
+решение → подтверждение) текстом и голосом. Внешние сервисы заменены локальными заглушками
+с настраиваемой задержкой и долей ошибок:
+  * Telegram Bot API (TelegramAPIServer) — принимает ответы бота и отдает файлы голосовых;
+  * DeepSeek chat/completions — обычные, JSON и потоковые (SSE) ответы;
+  * вебхук рекламаций — одиночные и пакетные POST.
+
+Пользователь отвечает по фактическому состоянию FSM, поэтому при сбоях ИИ диалог не
+рассинхронизируется, а просто занимает больше шагов. Отчет (JSON): завершенные диалоги в секунду
+и перцентили задержки по шагам — время от отправки апдейта до завершения его обработки.
+
+Запуск из корня проекта:
+    python -m benchmarks.dialog_load --users 50 --deepseek-latency 0.8 --deepseek-error-rate 0.05
+    python -m benchmarks.dialog_load --users 20 --voice-share 0.5 --deepseek-latency 3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from aiohttp import web
+
+from benchmarks.asr_bench import encode_ogg_opus, synthetic_voice
+
+BOT_TOKEN = "123456:LOAD-TEST"
+
+DETAILS = [
+    "Стучит двигатель на холодную, после прогрева стук пропадает",
+    "После замены масла загорелся чек и машина дергается при разгоне",
+    "Скрипят тормоза, а при торможении руль уводит вправо",
+]
+SOLUTIONS = [
+    "Прошу провести бесплатную диагностику и устранить неисправность",
+    "Хочу, чтобы заменили колодки по гарантии",
+    "Прошу вернуть деньги за последний ремонт",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Fault:
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        """Задержка ответа заглушки latency ± jitter секунд, доля ответов 500 — error_rate"""
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def delay(self):
+        seconds = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+class TelegramStub:
+    def __init__(self, fault: Fault, voice_files: Dict[str, bytes]):
+        """Bot API: sendMessage/editMessageText/deleteMessage/getFile и скачивание файлов"""
+        self.fault = fault
+        self.voice_files = voice_files
+        self.message_ids = itertools.count(10_000)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.sent: Dict[int, List[str]] = defaultdict(list)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.file)
+        return app
+
+    def message(self, chat_id: int, text: str, message_id: Optional[int] = None) -> dict:
+        return {
+            "message_id": message_id or next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 123456, "is_bot": True, "first_name": "bot"},
+            "text": text,
+        }
+
+    async def method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        form = await request.post()
+        await self.fault.delay()
+        if self.fault.fails():
+            return web.json_response({"ok": False, "error_code": 500, "description": "stub error"}, status=500)
+        if method == "sendMessage":
+            chat_id = int(form["chat_id"])
+            self.sent[chat_id].append(form.get("text", ""))
+            return web.json_response({"ok": True, "result": self.message(chat_id, form.get("text", ""))})
+        if method == "editMessageText":
+            chat_id = int(form["chat_id"])
+            return web.json_response({
+                "ok": True, "result": self.message(chat_id, form.get("text", ""), int(form["message_id"]))
+            })
+        if method == "getFile":
+            file_id = form["file_id"]
+            return web.json_response({"ok": True, "result": {
+                "file_id": file_id, "file_unique_id": file_id,
+                "file_size": len(self.voice_files.get(file_id, b"")), "file_path": f"voice/{file_id}.ogg",
+            }})
+        return web.json_response({"ok": True, "result": True})
+
+    async def file(self, request: web.Request) -> web.Response:
+        await self.fault.delay()
+        file_id = request.match_info["path"].rsplit("/", 1)[-1].removesuffix(".ogg")
+        return web.Response(body=self.voice_files[file_id], content_type="audio/ogg")
+
+
+class DeepSeekStub:
+    def __init__(self, fault: Fault, token_delay: float):
+        """chat/completions: ответ по системному промпту, JSON-режим и SSE с задержкой между фрагментами"""
+        self.fault = fault
+        self.token_delay = token_delay
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.complete)
+        return app
+
+    def reply(self, body: dict) -> str:
+        from core.utils.prompt import AUTO_RELEVANCE_SYSTEM_PROMPT, CONFIRMATION_CLASSIFIER_PROMPT
+
+        system = next((m["content"] for m in body["messages"] if m["role"] == "system"), "")
+        if body.get("response_format", {}).get("type") == "json_object":
+            self.calls["json"] += 1
+            # Подходит и совмещенной классификации, и исправлению с резюме
+            return json.dumps({"label": "YES", "text": body["messages"][-1]["content"], "summary": "стук в двигателе"},
+                              ensure_ascii=False)
+        if system in (CONFIRMATION_CLASSIFIER_PROMPT, AUTO_RELEVANCE_SYSTEM_PROMPT):
+            self.calls["classify"] += 1
+            return "YES"
+        self.calls["stream" if body.get("stream") else "text"] += 1
+        return "Вы сообщаете о стуке в двигателе после прогрева"
+
+    async def complete(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        await self.fault.delay()
+        if self.fault.fails():
+            self.errors += 1
+            return web.json_response({"error": {"message": "stub error"}}, status=500)
+        text = self.reply(body)
+        if not body.get("stream"):
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": text}}]})
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in text.split(" "):
+            chunk = {"choices": [{"delta": {"content": word + " "}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class WebhookStub:
+    def __init__(self, fault: Fault):
+        """Прием рекламаций: одиночный объект или массив (пакетная отправка)"""
+        self.fault = fault
+        self.requests = 0
+        self.errors = 0
+        self.keys = set()
+        self.duplicates = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self.receive)
+        return app
+
+    def accept(self, key: Optional[str]):
+        if key in self.keys:
+            self.duplicates += 1
+        self.keys.add(key)
+
+    async def receive(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        await self.fault.delay()
+        if self.fault.fails():
+            self.errors += 1
+            return web.json_response({"ok": False}, status=503)
+        if isinstance(body, list):
+            for item in body:
+                self.accept(item.get("idempotency_key"))
+            return web.json_response([{"idempotency_key": item.get("idempotency_key"), "status": 200} for item in body])
+        self.accept(request.headers.get("Idempotency-Key"))
+        return web.json_response({"ok": True})
+
+
+class LoadUser:
+    def __init__(self, user_id: int, voice_share: float, voice_ids: List[str], voice_durations: Dict[str, int]):
+        self.user_id = user_id
+        self.voice_share = voice_share
+        self.voice_ids = voice_ids
+        self.voice_durations = voice_durations
+        self.update_ids = itertools.count(user_id * 1_000_000)
+
+    def update(self, text: Optional[str] = None, voice_id: Optional[str] = None):
+        from aiogram.types import Update
+
+        message = {
+            "message_id": next(self.update_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user_id, "type": "private"},
+            "from": {"id": self.user_id, "is_bot": False, "first_name": "Нагрузка"},
+        }
+        if voice_id:
+            message["voice"] = {
+                "file_id": voice_id, "file_unique_id": voice_id,
+                "duration": self.voice_durations[voice_id], "mime_type": "audio/ogg",
+            }
+        else:
+            message["text"] = text
+        return Update.model_validate({"update_id": message["message_id"], "message": message})
+
+    def answer(self, state: Optional[str]):
+        """Ответ пользователя на текущем шаге: (шаг для отчета, апдейт)"""
+        from core.handlers.state.dialog import ClientDialog
+
+        use_voice = self.voice_ids and random.random() < self.voice_share
+        if state is None:
+            return "start", self.update("/start")
+        if state == ClientDialog.waiting_for_name.state:
+            return "name", self.update("Иван Петров")
+        if state == ClientDialog.waiting_for_phone.state:
+            return "phone", self.update("+79991234567")
+        if state == ClientDialog.waiting_for_details.state:
+            if use_voice:
+                return "details_voice", self.update(voice_id=random.choice(self.voice_ids))
+            return "details", self.update(random.choice(DETAILS))
+        if state == ClientDialog.waiting_for_confirmation.state:
+            return "confirmation", self.update("да")
+        if state == ClientDialog.waiting_for_solution.state:
+            if use_voice:
+                return "solution_voice", self.update(voice_id=random.choice(self.voice_ids))
+            return "solution", self.update(random.choice(SOLUTIONS))
+        if state == ClientDialog.waiting_for_solution_confirmation.state:
+            return "solution_confirmation", self.update("да")
+        return "other", self.update("/start")
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_s": float(np.percentile(values, 50)),
+        "p95_s": float(np.percentile(values, 95)),
+        "p99_s": float(np.percentile(values, 99)),
+        "max_s": max(values),
+    }
+
+
+async def run(args) -> Dict:
+    random.seed(args.seed)
+    voice_files: Dict[str, bytes] = {}
+    voice_durations: Dict[str, int] = {}
+    for index, duration in enumerate(args.voice_durations):
+        file_id = f"voice{index}"
+        voice_files[file_id] = encode_ogg_opus(synthetic_voice(duration, seed=index))
+        voice_durations[file_id] = int(duration)
+
+    telegram = TelegramStub(Fault(args.telegram_latency, args.telegram_latency / 2, 0.0), voice_files)
+    deepseek = DeepSeekStub(
+        Fault(args.deepseek_latency, args.deepseek_jitter, args.deepseek_error_rate), args.deepseek_token_delay
+    )
+    webhook = WebhookStub(Fault(args.webhook_latency, args.webhook_latency / 2, args.webhook_error_rate))
+    ports = {"telegram": free_port(), "deepseek": free_port(), "webhook": free_port()}
+    runners = [
+        await start_site(telegram.app(), ports["telegram"]),
+        await start_site(deepseek.app(), ports["deepseek"]),
+        await start_site(webhook.app(), ports["webhook"]),
+    ]
+
+    # Настройки бота читаются при импорте: адреса заглушек задаем до импорта core
+    workdir = tempfile.mkdtemp(prefix="dialog_load_")
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "DEEPSEEK_API_KEY": "load-test",
+        "DEEPSEEK_API_URL": f"http://127.0.0.1:{ports['deepseek']}/chat/completions",
+        "WEBHOOK_URL": f"http://127.0.0.1:{ports['webhook']}/",
+        "WEBHOOK_BULK_URL": f"http://127.0.0.1:{ports['webhook']}/",
+        "FSM_STORAGE_PATH": os.path.join(workdir, "fsm.sqlite3"),
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "LOG_DIR": os.path.join(workdir, "logs"),
+    })
+    for name, value in (("LOG_LEVEL", "WARNING"), ("LOG_CONSOLE", "0"), ("OUTBOX_RETRY_BASE_SECONDS", "0.5")):
+        os.environ.setdefault(name, value)
+
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.fsm.storage.base import StorageKey
+    from core.middlewares import setup_middlewares
+    from core.routers import routers
+    from core.services.audio import audio_processor
+    from core.services.deepseek import deepseek_client
+    from core.services.outbox import outbox
+    from core.services.storage import SQLiteStorage
+    from core.services.webhook import webhook_session
+    from core.utils.logs import setup_logging, shutdown_logging
+    from settings import FSM_STORAGE_PATH
+
+    setup_logging()
+    voice_share = args.voice_share
+    if voice_share:
+        await audio_processor.start()
+        if not audio_processor.is_model_ready():
+            print(json.dumps({"warning": "модель Vosk не загрузилась, голосовые шаги отключены"}, ensure_ascii=False))
+            voice_share = 0.0
+
+    storage = SQLiteStorage(FSM_STORAGE_PATH)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{ports['telegram']}"))
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = Dispatcher(storage=storage)
+    setup_middlewares(dp)
+    dp.include_routers(*routers)
+    outbox.start()
+
+    step_latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    completed = 0
+    abandoned = 0
+
+    async def user_session(user_id: int):
+        nonlocal completed, abandoned
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        user = LoadUser(user_id, voice_share, list(voice_files), voice_durations)
+        key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+        for _ in range(args.dialogs):
+            finished = False
+            for _ in range(args.max_steps):
+                state = await storage.get_state(key)
+                step, update = user.answer(state)
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception as e:
+                    errors[f"{step}:{type(e).__name__}"] += 1
+                step_latencies[step].append(time.perf_counter() - started)
+                if step == "solution_confirmation" and await storage.get_state(key) is None:
+                    finished = True
+                    break
+                if args.think:
+                    await asyncio.sleep(random.uniform(0, 2 * args.think))
+            if finished:
+                completed += 1
+            else:
+                abandoned += 1
+                await storage.set_state(key, None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(100_000 + index) for index in range(args.users)))
+    wall = time.perf_counter() - started
+
+    # Даем фоновой отправке доставить рекламации
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline and outbox.stats()["pending"]:
+        await asyncio.sleep(0.2)
+    outbox_stats = outbox.stats()
+
+    await outbox.stop()
+    await deepseek_client.close()
+    await webhook_session.close()
+    await bot.session.close()
+    await storage.close()
+    audio_processor.shutdown()
+    for runner in runners:
+        await runner.cleanup()
+    shutdown_logging()
+
+    return {
+        "users": args.users,
+        "dialogs_per_user": args.dialogs,
+        "voice_share": voice_share,
+        "deepseek": {"latency_s": args.deepseek_latency, "error_rate": args.deepseek_error_rate,
+                     "calls": dict(deepseek.calls), "errors_injected": deepseek.errors},
+        "wall_s": wall,
+        "completed": completed,
+        "abandoned": abandoned,
+        "completions_per_s": completed / wall if wall else 0.0,
+        "steps": {step: summarize(values) for step, values in sorted(step_latencies.items())},
+        "errors": dict(errors),
+        "telegram_calls": dict(telegram.calls),
+        "webhook": {"requests": webhook.requests, "errors_injected": webhook.errors,
+                    "unique_claims": len(webhook.keys), "duplicates": webhook.duplicates},
+        "outbox": outbox_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--dialogs", type=int, default=1, help="диалогов подряд на пользователя")
+    parser.add_argument("--ramp", type=float, default=2.0, help="пользователи стартуют в течение стольких секунд")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза пользователя между сообщениями, с")
+    parser.add_argument("--max-steps", type=int, default=20, help="после стольких сообщений диалог считается брошенным")
+    parser.add_argument("--voice-share", type=float, default=0.0, help="доля ответов голосом на шагах деталей и решения")
+    parser.add_argument("--voice-durations", type=float, nargs="+", default=[3, 8, 20])
+    parser.add_argument("--deepseek-latency", type=float, default=0.5)
+    parser.add_argument("--deepseek-jitter", type=float, default=0.2)
+    parser.add_argument("--deepseek-error-rate", type=float, default=0.0)
+    parser.add_argument("--deepseek-token-delay", type=float, default=0.02, help="пауза между фрагментами SSE, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--webhook-latency", type=float, default=0.1)
+    parser.add_argument("--webhook-error-rate", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="записать отчет в файл")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Бенчмарк преобразования частоты дискретизации для конвейера Vosk.
+
+Сравнивает встроенный полифазный ресемплер (core.utils.resample) и прямое
+декодирование Ogg/Opus в 16 кГц через libopus с прежним путем через librosa.resample.
+
+Запуск из корня проекта:
+    python -m benchmarks.resample_bench --durations 5 60 300
+"""
+
+import argparse
+import io
+import json
+import time
+
+import numpy as np
+import soundfile as sf
+
+from core.utils.opus import decode_ogg_opus, load_libopus
+from core.utils.resample import resample_poly
+
+
+def best_of(func, repeats: int) -> float:
+    """Минимальное время выполнения func за repeats запусков, миллисекунды"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def synthetic_signal(duration: float, samplerate: int) -> np.ndarray:
+    """Речеподобный тестовый сигнал: модулированный тон плюс шум"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * samplerate)) / samplerate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    signal = envelope * np.sin(2 * np.pi * (180 + 40 * np.sin(2 * np.pi * 0.5 * t)) * t)
+    signal += 0.05 * rng.standard_normal(len(t))
+    return (0.3 * signal).astype(np.float32)
+
+
+def run(durations, rates, repeats: int):
+    try:
+        import librosa
+    except ImportError:
+        librosa = None
+
+    results = []
+    for samplerate in rates:
+        for duration in durations:
+            signal = synthetic_signal(duration, samplerate)
+            row = {"samplerate": samplerate, "duration_s": duration}
+            row["poly_ms"] = best_of(lambda: resample_poly(signal, samplerate, 16000), repeats)
+            if librosa is not None:
+                # Первый вызов librosa включает импорт и JIT — его видит первое голосовое
+                started = time.perf_counter()
+                reference = librosa.resample(signal, orig_sr=samplerate, target_sr=16000)
+                row["librosa_first_call_ms"] = (time.perf_counter() - started) * 1000
+                row["librosa_ms"] = best_of(
+                    lambda: librosa.resample(signal, orig_sr=samplerate, target_sr=16000), repeats
+                )
+                ours = resample_poly(signal, samplerate, 16000)
+                size = min(len(ours), len(reference))
+                error = ours[:size] - reference[:size]
+                row["snr_vs_librosa_db"] = float(
+                    10 * np.log10(np.sum(reference[:size] ** 2) / max(np.sum(error ** 2), 1e-20))
+                )
+            if samplerate == 48000 and load_libopus() is not None:
+                buffer = io.BytesIO()
+                sf.write(buffer, signal, samplerate, format="OGG", subtype="OPUS")
+                encoded = buffer.getvalue()
+                row["opus_native_16k_decode_ms"] = best_of(lambda: decode_ogg_opus(encoded, 16000), repeats)
+                row["opus_48k_decode_plus_poly_ms"] = best_of(
+                    lambda: resample_poly(sf.read(io.BytesIO(encoded), dtype="float32")[0], samplerate, 16000),
+                    repeats,
+                )
+            results.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 10, 60, 300])
+    parser.add_argument("--rates", type=int, nargs="+", default=[48000, 44100, 8000])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.durations, args.rates, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,139 @@
 import asyncio
 import logging
+import secrets
+import signal
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from settings import BOT_TOKEN
+from settings import (
+    BOT_TOKEN,
+    FSM_STORAGE_PATH,
+    BOT_MODE,
+    TELEGRAM_WEBHOOK_URL,
+    TELEGRAM_WEBHOOK_PATH,
+    TELEGRAM_WEBHOOK_SECRET,
+    METRICS_ENABLED,
+    WEB_SERVER_HOST,
+    WEB_SERVER_PORT,
+)
 from core.routers import routers
+from core.middlewares import setup_middlewares
+from core.services.deepseek import deepseek_client
+from core.services.audio import audio_processor
+from core.services.storage import SQLiteStorage
+from core.services.outbox import outbox
+from core.services.webhook import webhook_session
+from core.services.monitoring import setup_monitoring
+from core.utils.logs import setup_logging, shutdown_logging
+
+# Фоновые задачи запуска (держим ссылки, чтобы их не собрал сборщик мусора)
+background_tasks = set()
+
+async def on_startup():
+    # Модель Vosk загружается и прогревается в фоне: текстовые диалоги обслуживаются сразу
+    background_tasks.add(audio_processor.start())
+    # Открываем пул соединений с DeepSeek заранее, чтобы первый диалог не ждал TLS-рукопожатия
+    if deepseek_client.is_configured():
+        background_tasks.add(asyncio.create_task(deepseek_client.warmup()))
+    # Доставка рекламаций, оставшихся в очереди с прошлого запуска, и новых
+    outbox.start()
+
+async def on_shutdown(dispatcher: Dispatcher):
+    await deepseek_client.close()
+    await outbox.stop()
+    await webhook_session.close()
+    audio_processor.shutdown()
+
+async def start_web_server(app: web.Application) -> web.AppRunner:
+    """Запускает HTTP-сервер бота на WEB_SERVER_HOST:WEB_SERVER_PORT"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, WEB_SERVER_HOST, WEB_SERVER_PORT).start()
+    except Exception:
+        await runner.cleanup()
+        raise
+    return runner
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Long polling; рядом на том же порту, что и в webhook-режиме, отдаются /metrics и /ready"""
+    await bot.delete_webhook(drop_pending_updates=True)
+    runner = None
+    if METRICS_ENABLED:
+        app = web.Application()
+        setup_monitoring(app, dp.storage)
+        runner = await start_web_server(app)
+        logging.info(f"Метрики: http://{WEB_SERVER_HOST}:{WEB_SERVER_PORT}/metrics")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Принимает апдейты HTTP-запросами от Telegram: запрос подтверждается сразу,
+    обработка идет фоновой задачей. Рассчитан на один инстанс: состояния диалогов лежат в локальном
+    файле SQLite, а справедливая очередь, очередь распознавания и outbox живут в процессе
+    """
+    if not TELEGRAM_WEBHOOK_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужно задать TELEGRAM_WEBHOOK_URL")
+    secret = TELEGRAM_WEBHOOK_SECRET
+    if not secret:
+        # Случайный секрет годится только для одного инстанса: у каждого он будет свой
+        secret = secrets.token_urlsafe(32)
+        logging.warning("TELEGRAM_WEBHOOK_SECRET не задан, сгенерирован секрет на время работы процесса")
+    
+    app = web.Application()
+    setup_monitoring(app, dp.storage)
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=True
+    ).register(app, path=TELEGRAM_WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = await start_web_server(app)
+    try:
+        # Необработанные апдейты не сбрасываем: Telegram доставит их после перезапуска
+        await bot.set_webhook(
+            url=TELEGRAM_WEBHOOK_URL.rstrip("/") + TELEGRAM_WEBHOOK_PATH,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logging.info(f"Webhook-режим: слушаю {WEB_SERVER_HOST}:{WEB_SERVER_PORT}{TELEGRAM_WEBHOOK_PATH}")
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+    finally:
+        # Вызывает on_shutdown диспетчера и закрывает сессию бота
+        await runner.cleanup()
 
 async def main():
+    # Логи пишет фоновый поток: в ротируемые JSON-файлы в ./logs и в stdout
+    setup_logging()
     try:
-        logging.basicConfig(level=logging.INFO)
-        storage = MemoryStorage()
+        # Состояния диалогов хранятся в SQLite: незавершенные рекламации переживают перезапуск
+        storage = SQLiteStorage(FSM_STORAGE_PATH)
         bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
         dp = Dispatcher(bot=bot, storage=storage)
+        setup_middlewares(dp)
         dp.include_routers(*routers)
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        dp.startup.register(on_startup)
+        dp.shutdown.register(on_shutdown)
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     except Exception as e:
-        logging.error(f"Ошибка при запуске бота: {e}")
+        logging.exception(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        shutdown_logging()
 
 def start_app():
     asyncio.run(main())
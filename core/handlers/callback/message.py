@@ -1,13 +1,23 @@
 import asyncio
+import html
+import logging
+from typing import Awaitable, Callable, Optional
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from core.services.ai import ask_ai, classify_confirmation
+from core.services.ai import ask_ai
+from core.services.confirmation import confirmation_classifier
+from core.services.deepseek import DeepSeekError
 from core.utils.ai import validate_phone, format_phone
 from core.handlers.state.dialog import ClientDialog
 from core.utils.messages import *
 from core.utils.summary import create_problem_summary, update_problem_summary, create_solution_summary, update_solution_summary
-from core.services.webhook import send_client_data_to_webhook, format_client_data_for_webhook
+from core.services.webhook import format_client_data_for_webhook
+from core.services.outbox import outbox
+from core.utils.config import DEEPSEEK_STREAMING, DEEPSEEK_STREAM_EDIT_INTERVAL
+from core.utils.progress import ThrottledEditor
+
+logger = logging.getLogger(__name__)
 
 router = Router(name="core_message_router")
 
@@ -89,93 +99,132 @@ async def handle_phone_step(message: types.Message, state: FSMContext, user_mess
 
 
 
-async def handle_details_step(message: types.Message, state: FSMContext, user_message: str):
-    """Обработка шага ввода деталей обращения"""
-    await state.update_data(client_details=user_message)
+async def answer_streamed_summary(
+    message: types.Message,
+    template: str,
+    make_summary: Callable[[Callable[[str], Awaitable[None]]], Awaitable[str]],
+) -> str:
+    """
+    Сразу отправляет заготовку и дописывает в нее резюме по мере генерации
+    (правки не чаще DEEPSEEK_STREAM_EDIT_INTERVAL), затем ставит итоговый текст по шаблону.
+    Резюме экранируется: сообщения уходят с parse_mode=HTML, а оборванный «<» или «&» ломает правку
+    """
+    placeholder = await message.answer(SUMMARY_PLACEHOLDER)
+    editor = ThrottledEditor(placeholder, DEEPSEEK_STREAM_EDIT_INTERVAL)
+    prefix = template.split("{summary}")[0]
     
-    # Получаем все собранные данные
-    data = await state.get_data()
+    async def show_partial(text: str):
+        await editor.update(prefix + html.escape(text) + "…")
     
+    summary = await make_summary(show_partial)
+    await editor.finish(template.format(summary=html.escape(summary)))
+    return summary
+
+async def handle_details_step(message: types.Message, state: FSMContext, user_message: str, summary: Optional[str] = None):
+    """Обработка шага ввода деталей обращения (summary уже готово, если его вернул голосовой конвейер)"""
     # Создаем резюме проблемы (используем детали как тему и детали)
-    summary = create_problem_summary("Проблема клиента", user_message)
-    
-    # Сохраняем резюме в состоянии
-    await state.update_data(problem_summary=summary)
-    
-    # Формируем подтверждение с резюме
-    confirmation_text = CONFIRMATION_TEMPLATE.format(summary=summary)
-    await message.answer(confirmation_text)
+    if summary is None and DEEPSEEK_STREAMING:
+        # Резюме появляется в сообщении по мере генерации
+        summary = await answer_streamed_summary(
+            message,
+            CONFIRMATION_TEMPLATE,
+            lambda on_partial: create_problem_summary("Проблема клиента", user_message, on_partial),
+        )
+    else:
+        if summary is None:
+            summary = await create_problem_summary("Проблема клиента", user_message)
+        # Формируем подтверждение с резюме
+        confirmation_text = CONFIRMATION_TEMPLATE.format(summary=html.escape(summary))
+        await message.answer(confirmation_text)
+    
+    # Сохраняем детали и резюме в состоянии
+    await state.update_data(client_details=user_message, problem_summary=summary)
     await state.set_state(ClientDialog.waiting_for_confirmation)
 
 async def handle_confirmation_step(message: types.Message, state: FSMContext, user_message: str):
     """Обработка шага подтверждения"""
     user_response = user_message.strip()
+    data = await state.get_data()
+    original_summary = data.get('problem_summary', '')
     
-    # Пробуем классификацию через ИИ
-    label = classify_confirmation(user_response)
-    if label == "YES" or user_response.lower() in POSITIVE_ANSWERS:
+    # Очевидные «да»/«нет» решаются локально, остальное — ИИ (с кэшем вердиктов)
+    try:
+        label, new_summary = await confirmation_classifier.classify(user_response, original_summary, subject="problem")
+    except DeepSeekError as e:
+        logger.warning("❌ Подтверждение не классифицировано: %s", e, extra={"user_id": message.from_user.id})
+        await message.answer(AI_UNAVAILABLE_MESSAGE)
+        return
+    if label == "YES":
         await message.answer(SOLUTION_REQUEST)
         await state.set_state(ClientDialog.waiting_for_solution)
         return
-    if label == "NO" or user_response.lower() in NEGATIVE_ANSWERS:
+    if label == "NO":
         await message.answer("Хорошо, давайте исправим. " + TOPIC_REQUEST)
         await state.set_state(ClientDialog.waiting_for_details)
         return
     
     # Иначе считаем как уточнение
-    data = await state.get_data()
-    original_summary = data.get('problem_summary', '')
-    new_summary = update_problem_summary(original_summary, user_message)
+    if new_summary is None:
+        new_summary = await update_problem_summary(original_summary, user_message)
     await state.update_data(problem_summary=new_summary)
-    confirmation_text = CONFIRMATION_UPDATE_TEMPLATE.format(summary=new_summary)
+    confirmation_text = CONFIRMATION_UPDATE_TEMPLATE.format(summary=html.escape(new_summary))
     await message.answer(confirmation_text)
 
-async def handle_solution_step(message: types.Message, state: FSMContext, user_message: str):
-    """Обработка шага предложения решения"""
-    # Сохраняем предложение решения
-    await state.update_data(client_solution=user_message)
-    
+async def handle_solution_step(message: types.Message, state: FSMContext, user_message: str, summary: Optional[str] = None):
+    """Обработка шага предложения решения (summary уже готово, если его вернул голосовой конвейер)"""
     # Создаем резюме предложения решения
-    summary = create_solution_summary(user_message)
-    
-    # Сохраняем резюме в состоянии
-    await state.update_data(solution_summary=summary)
-    
-    # Формируем подтверждение с резюме
-    confirmation_text = SOLUTION_CONFIRMATION_TEMPLATE.format(summary=summary)
-    await message.answer(confirmation_text)
+    if summary is None and DEEPSEEK_STREAMING:
+        # Резюме появляется в сообщении по мере генерации
+        summary = await answer_streamed_summary(
+            message,
+            SOLUTION_CONFIRMATION_TEMPLATE,
+            lambda on_partial: create_solution_summary(user_message, on_partial),
+        )
+    else:
+        if summary is None:
+            summary = await create_solution_summary(user_message)
+        # Формируем подтверждение с резюме
+        confirmation_text = SOLUTION_CONFIRMATION_TEMPLATE.format(summary=html.escape(summary))
+        await message.answer(confirmation_text)
+    
+    # Сохраняем предложение решения и резюме в состоянии
+    await state.update_data(client_solution=user_message, solution_summary=summary)
     await state.set_state(ClientDialog.waiting_for_solution_confirmation)
 
 async def handle_solution_confirmation_step(message: types.Message, state: FSMContext, user_message: str):
     """Обработка шага подтверждения предложения решения"""
     user_response = user_message.strip()
+    data = await state.get_data()
+    original_summary = data.get('solution_summary', '')
     
-    # Пробуем классификацию через ИИ
-    label = classify_confirmation(user_response)
-    if label == "YES" or user_response.lower() in POSITIVE_ANSWERS:
-        data = await state.get_data()
-        print(f"📋 Данные клиента из состояния: {data}")
+    # Очевидные «да»/«нет» решаются локально, остальное — ИИ (с кэшем вердиктов)
+    try:
+        label, new_summary = await confirmation_classifier.classify(user_response, original_summary, subject="solution")
+    except DeepSeekError as e:
+        logger.warning("❌ Подтверждение не классифицировано: %s", e, extra={"user_id": message.from_user.id})
+        await message.answer(AI_UNAVAILABLE_MESSAGE)
+        return
+    if label == "YES":
         client_data = format_client_data_for_webhook(
             name=data.get('client_name', ''),
             phone=data.get('client_phone', ''),
             problem_description=data.get('client_details', ''),
             client_offer=data.get('client_solution', '')
         )
-        print("🚀 Отправляю данные на вебхук...")
-        webhook_success = send_client_data_to_webhook(client_data)
-        print(f"📊 Результат отправки: {'✅ Успешно' if webhook_success else '❌ Ошибка'}")
+        # Рекламация сохраняется на диск, доставку на вебхук выполняет фоновая очередь
+        key = await outbox.enqueue(client_data)
+        logger.info("📋 Рекламация оформлена", extra={"user_id": message.from_user.id, "idempotency_key": key})
         await message.answer(SUCCESS_TEMPLATE)
         await state.clear()
         return
-    if label == "NO" or user_response.lower() in NEGATIVE_ANSWERS:
+    if label == "NO":
         await message.answer("Хорошо, давайте исправим. " + SOLUTION_REQUEST)
         await state.set_state(ClientDialog.waiting_for_solution)
         return
     
     # Иначе считаем как уточнение
-    data = await state.get_data()
-    original_summary = data.get('solution_summary', '')
-    new_summary = update_solution_summary(original_summary, user_message)
+    if new_summary is None:
+        new_summary = await update_solution_summary(original_summary, user_message)
     await state.update_data(solution_summary=new_summary)
-    confirmation_text = SOLUTION_CONFIRMATION_UPDATE_TEMPLATE.format(summary=new_summary)
+    confirmation_text = SOLUTION_CONFIRMATION_UPDATE_TEMPLATE.format(summary=html.escape(new_summary))
     await message.answer(confirmation_text) 
\ No newline at end of file
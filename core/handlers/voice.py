@@ -1,8 +1,19 @@
+import html
+import logging
 from aiogram import Router, F
 from aiogram.types import Message, Voice
 from aiogram.fsm.context import FSMContext
 from core.services.audio import audio_processor
-from core.services.ai import fix_grammar
+from core.services.ai import fix_grammar, fix_grammar_and_summarize
+from core.services.deepseek import DeepSeekError
+from core.services.grammar_gate import correction_gate
+from core.services.asr_models import CONFIRMATION_STEP
+from core.services.asr_queue import asr_queue
+from core.services.scheduler import fair_scheduler
+from core.utils.messages import (
+    VOICE_QUEUE_POSITION_TEMPLATE, VOICE_QUEUE_FULL_MESSAGE, VOICE_TOO_LONG_TEMPLATE, AI_UNAVAILABLE_MESSAGE,
+    VOICE_MODEL_LOADING_MESSAGE, VOICE_UNAVAILABLE_MESSAGE, TOO_MANY_REQUESTS_MESSAGE,
+)
 from core.handlers.state.dialog import ClientDialog
 from core.handlers.callback.message import (
     handle_details_step, 
@@ -11,23 +22,42 @@ from core.handlers.callback.message import (
     handle_solution_confirmation_step
 )
 
+logger = logging.getLogger(__name__)
+
 router = Router(name="voice_handler")
 
+# Шаги, где по тексту сразу составляется резюме (проблемы или предложения решения)
+SUMMARY_STEPS = {
+    ClientDialog.waiting_for_details.state: "problem",
+    ClientDialog.waiting_for_solution.state: "solution",
+}
+
+# Шаги «да/нет»: сервисы распознавания получают вид шага строкой, а не состояние диалога
+CONFIRMATION_STATES = {
+    ClientDialog.waiting_for_confirmation.state,
+    ClientDialog.waiting_for_solution_confirmation.state,
+}
+
+def voice_not_ready_message() -> str:
+    """Ответ на голосовое, пока распознавание не готово: ждать загрузки или запуск не удался"""
+    if audio_processor.startup_error is not None:
+        return VOICE_UNAVAILABLE_MESSAGE
+    return VOICE_MODEL_LOADING_MESSAGE
+
 @router.message(F.voice)
 async def handle_voice_message(message: Message, state: FSMContext):
     """Обработка голосовых сообщений"""
     
-    print(f"🎤 Получено голосовое сообщение от пользователя {message.from_user.id}")
+    logger.debug("🎤 Голосовое сообщение от пользователя %s", message.from_user.id)
     
     # Проверяем готовность модели
     if not audio_processor.is_model_ready():
-        print("❌ Модель Vosk не готова")
-        await message.answer("🔄 Модель распознавания речи еще загружается. Попробуйте через несколько секунд.")
+        logger.info("❌ Модель Vosk не готова, голосовое сообщение отклонено")
+        await message.answer(voice_not_ready_message())
         return
     
     # Получаем текущее состояние диалога
     current_state = await state.get_state()
-    print(f"📊 Текущее состояние диалога: {current_state}")
     
     # Обрабатываем голосовое сообщение с 3-го по 6-й шаг (после изменений в структуре диалога)
     allowed_states = [
@@ -37,36 +67,94 @@ async def handle_voice_message(message: Message, state: FSMContext):
         ClientDialog.waiting_for_solution_confirmation.state
     ]
     
-    print(f"✅ Разрешенные состояния: {allowed_states}")
-    
     if current_state not in allowed_states:
-        print(f"❌ Состояние {current_state} не разрешено для голосовых сообщений")
         await message.answer("🎤 Голосовые сообщения принимаются только с 3-го по 6-й шаг. Пожалуйста, используйте текстовое сообщение для продолжения диалога.")
         return
+    step_kind = CONFIRMATION_STEP if current_state in CONFIRMATION_STATES else "text"
+    
+    # Длительность и загрузку очереди проверяем до скачивания файла
+    rejection = asr_queue.precheck(message.voice)
+    if rejection == "too_long":
+        logger.info("❌ Голосовое сообщение слишком длинное: %s с", message.voice.duration)
+        await message.answer(VOICE_TOO_LONG_TEMPLATE.format(limit=int(asr_queue.max_audio_seconds // 60)))
+        return
+    if rejection == "queue_full":
+        logger.warning("❌ Очередь распознавания заполнена")
+        await message.answer(VOICE_QUEUE_FULL_MESSAGE)
+        return
+    
+    # Лимиты пользователя списываются только за принятое голосовое. Общего места в планировщике оно не занимает:
+    # одновременное распознавание ограничивает очередь ASR, а ее место до ожидания токенов заняло бы воркер впустую
+    asr_seconds = float(message.voice.duration or 0)
+    if not await fair_scheduler.charge(message.from_user.id, asr_seconds, 1.0):
+        await message.answer(TOO_MANY_REQUESTS_MESSAGE)
+        return
     
     # Отправляем сообщение о начале обработки
     processing_msg = await message.answer("🎤 Обрабатываю голосовое сообщение...")
-    print("🎤 Начинаю обработку голосового сообщения...")
     
     try:
-        # Распознаем речь
-        print("🎤 Вызываю audio_processor.process_voice_message...")
-        recognized_text = await audio_processor.process_voice_message(message.voice, message.bot)
+        queued = False
+        
+        async def show_position(position: int):
+            # Место в очереди обновляется в том же сообщении
+            nonlocal queued
+            queued = True
+            await processing_msg.edit_text(VOICE_QUEUE_POSITION_TEMPLATE.format(position=position))
         
-        print(f"🎤 Результат распознавания: '{recognized_text}'")
+        async with asr_queue.slot(asr_seconds, message.voice.file_size, show_position) as admitted:
+            if not admitted:
+                # Очередь заполнилась, пока ждали токенов: голосовое не обработано, лимиты возвращаем
+                logger.warning("❌ Очередь распознавания заполнена")
+                fair_scheduler.refund(message.from_user.id, asr_seconds, 1.0)
+                await processing_msg.edit_text(VOICE_QUEUE_FULL_MESSAGE)
+                return
+            if queued:
+                await processing_msg.edit_text("🎤 Обрабатываю голосовое сообщение...")
+            
+            # Распознаем речь
+            if audio_processor.streaming:
+                async def show_partial(text: str):
+                    # Промежуточный текст появляется в том же сообщении (частоту правок ограничивает процессор)
+                    await processing_msg.edit_text(f"🎤 Распознаю: {html.escape(text)}…")
+                
+                recognition = await audio_processor.stream_voice_message(
+                    message.voice, message.bot, show_partial, step=step_kind
+                )
+            else:
+                recognition = await audio_processor.process_voice_message(message.voice, message.bot, step=step_kind)
+        recognized_text = recognition.text if recognition else None
         
         if not recognized_text:
-            print("❌ Распознанный текст пустой")
+            logger.info("❌ Речь не распознана", extra={"user_id": message.from_user.id})
             await processing_msg.edit_text("❌ Не удалось распознать речь. Попробуйте еще раз или отправьте текстовое сообщение.")
             return
         
-        # Исправляем грамматику распознанного текста
-        print("🔧 Исправляю грамматику...")
-        corrected_text = fix_grammar(recognized_text)
-        print(f"🔧 Исправленный текст: '{corrected_text}'")
+        # На шагах с резюме исправление и резюме получаем одним запросом
+        summary = None
+        subject = SUMMARY_STEPS.get(current_state)
+        try:
+            fused = await fix_grammar_and_summarize(recognized_text, subject) if subject else None
+        except DeepSeekError as e:
+            # Сервис не отвечает: два отдельных запроса к нему только удлинили бы ожидание
+            logger.warning("❌ Голосовой ответ не обработан: %s", e, extra={"user_id": message.from_user.id})
+            await processing_msg.edit_text(AI_UNAVAILABLE_MESSAGE)
+            return
+        if fused is not None:
+            corrected_text, summary = fused
+        else:
+            # Исправляем грамматику, если текст не короткий и уверенный и шаг не требует только «да/нет»
+            needs_correction, _ = correction_gate.decide(recognized_text, recognition.confidences, step_kind)
+            if needs_correction:
+                corrected_text = await fix_grammar(recognized_text)
+            else:
+                corrected_text = recognized_text
+        logger.debug(
+            "🎤 Распознано: '%s' -> '%s'", recognized_text, corrected_text,
+            extra={"user_id": message.from_user.id, "step": current_state},
+        )
         
         # Убираем сообщение о начале обработки
-        print("✅ Удаляю сообщение о начале обработки")
         await processing_msg.delete()
         
         # Используем исправленный текст для дальнейшей обработки
@@ -74,17 +162,17 @@ async def handle_voice_message(message: Message, state: FSMContext):
         
         # Обрабатываем как обычное текстовое сообщение в зависимости от текущего шага
         if current_state == ClientDialog.waiting_for_details.state:
-            await handle_details_step(message, state, final_text)
+            await handle_details_step(message, state, final_text, summary=summary)
         elif current_state == ClientDialog.waiting_for_confirmation.state:
             await handle_confirmation_step(message, state, final_text)
         elif current_state == ClientDialog.waiting_for_solution.state:
-            await handle_solution_step(message, state, final_text)
+            await handle_solution_step(message, state, final_text, summary=summary)
         elif current_state == ClientDialog.waiting_for_solution_confirmation.state:
             await handle_solution_confirmation_step(message, state, final_text)
         
     except Exception as e:
-        await processing_msg.edit_text(f"❌ Произошла ошибка при обработке голосового сообщения: {str(e)}")
-        print(f"Ошибка в обработке голосового сообщения: {e}")
+        await processing_msg.edit_text(f"❌ Произошла ошибка при обработке голосового сообщения: {html.escape(str(e))}")
+        logger.exception("Ошибка в обработке голосового сообщения: %s", e)
 
 @router.message(F.audio)
 async def handle_audio_message(message: Message, state: FSMContext):
@@ -107,7 +195,7 @@ async def handle_audio_message(message: Message, state: FSMContext):
     
     # Проверяем готовность модели
     if not audio_processor.is_model_ready():
-        await message.answer("🔄 Модель распознавания речи еще загружается. Попробуйте через несколько секунд.")
+        await message.answer(voice_not_ready_message())
         return
     
     # Отправляем сообщение о начале обработки
@@ -119,5 +207,5 @@ async def handle_audio_message(message: Message, state: FSMContext):
         await processing_msg.edit_text("⚠️ Обработка аудио файлов пока не поддерживается. Отправьте голосовое сообщение.")
         
     except Exception as e:
-        await processing_msg.edit_text(f"❌ Произошла ошибка при обработке аудио файла: {str(e)}")
-        print(f"Ошибка в обработке аудио файла: {e}") 
\ No newline at end of file
+        await processing_msg.edit_text(f"❌ Произошла ошибка при обработке аудио файла: {html.escape(str(e))}")
+        logger.exception("Ошибка в обработке аудио файла: %s", e) 
\ No newline at end of file
@@ -0,0 +1,16 @@
+from aiogram import Dispatcher
+
+from core.middlewares.metrics import UpdateTimingMiddleware
+from core.middlewares.storage import StorageBatchMiddleware
+from core.middlewares.fairness import FairSchedulingMiddleware
+from core.services.scheduler import fair_scheduler
+
+
+def setup_middlewares(dp: Dispatcher):
+    """Подключает общие middleware к диспетчеру"""
+    # Замер полной обработки апдейта (включая запись состояния и ожидание в очереди)
+    dp.update.outer_middleware(UpdateTimingMiddleware())
+    if hasattr(dp.storage, "batch"):
+        dp.update.outer_middleware(StorageBatchMiddleware(dp.storage))
+    # Шаги с ИИ проходят через справедливую очередь с лимитами на пользователя (голос списывает их в обработчике)
+    dp.message.outer_middleware(FairSchedulingMiddleware(fair_scheduler))
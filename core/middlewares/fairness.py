@@ -0,0 +1,66 @@
+"""
+Допуск дорогих текстовых сообщений (шаги с вызовами ИИ) через справедливый планировщик
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+from core.handlers.state.dialog import ClientDialog
+from core.services.confirmation import confirmation_classifier
+from core.services.scheduler import FairScheduler
+from core.utils.messages import TOO_MANY_REQUESTS_MESSAGE
+
+# Шаги диалога, на которых сообщение обрабатывается вызовами ИИ
+LLM_STEPS = {
+    ClientDialog.waiting_for_details.state,
+    ClientDialog.waiting_for_confirmation.state,
+    ClientDialog.waiting_for_solution.state,
+    ClientDialog.waiting_for_solution_confirmation.state,
+}
+
+# Шаги «да/нет»: очевидные ответы классифицируются без ИИ
+CONFIRMATION_STATES = {
+    ClientDialog.waiting_for_confirmation.state,
+    ClientDialog.waiting_for_solution_confirmation.state,
+}
+
+
+def estimate_cost(message: Message, step: Optional[str]) -> Tuple[float, float]:
+    """
+    Оценка стоимости сообщения: (секунды распознавания, вызовы ИИ); (0, 0) — дешевое сообщение.
+    Голосовые здесь не учитываются: их лимиты списывает обработчик после проверок очереди распознавания
+    """
+    if step not in LLM_STEPS:
+        return 0.0, 0.0
+    if message.text and not message.text.startswith("/"):
+        if step in CONFIRMATION_STATES and confirmation_classifier.decides_without_ai(message.text.strip()):
+            # «да», «всё верно» и т. п. не тратят токен ИИ пользователя
+            return 0.0, 0.0
+        return 0.0, 1.0
+    return 0.0, 0.0
+
+
+class FairSchedulingMiddleware(BaseMiddleware):
+    def __init__(self, scheduler: FairScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        state: Optional[FSMContext] = data.get("state")
+        step = await state.get_state() if state is not None else None
+        asr_seconds, llm_calls = estimate_cost(event, step)
+        if not asr_seconds and not llm_calls or event.from_user is None:
+            return await handler(event, data)
+
+        async with self.scheduler.admit(event.from_user.id, asr_seconds, llm_calls) as admitted:
+            if not admitted:
+                await event.answer(TOO_MANY_REQUESTS_MESSAGE)
+                return None
+            return await handler(event, data)
@@ -0,0 +1,49 @@
+"""
+Время полной обработки апдейта для метрик: от входа в диспетчер до завершения ответа
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from core.services.metrics import UPDATE_SECONDS
+
+
+def update_kind(update: Update) -> str:
+    if update.message:
+        if update.message.voice:
+            return "voice"
+        if update.message.audio:
+            return "audio"
+        if update.message.text:
+            return "command" if update.message.text.startswith("/") else "text"
+        return "message"
+    if update.callback_query:
+        return "callback"
+    return "other"
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Подключается первым, поэтому в замер входит и ожидание в справедливой очереди"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        finally:
+            UPDATE_SECONDS.observe(
+                time.perf_counter() - started,
+                kind=update_kind(event),
+                step=data.get("raw_state") or "none",
+                outcome=outcome,
+            )
@@ -0,0 +1,23 @@
+"""
+Объединение записей FSM: все изменения состояния за одну обработку апдейта — одна транзакция
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class StorageBatchMiddleware(BaseMiddleware):
+    def __init__(self, storage):
+        """storage должен поддерживать batch() (см. core.services.storage.SQLiteStorage)"""
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self.storage.batch():
+            return await handler(event, data)
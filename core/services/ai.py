@@ -1,8 +1,30 @@
-import requests
-from core.utils.config import DEEPSEEK_API_KEY, API_URL, DEEPSEEK_MODEL
-from core.utils.prompt import SYSTEM_PROMPT, OFF_TOPIC_RESPONSE, AUTO_RELEVANCE_SYSTEM_PROMPT, CONFIRMATION_CLASSIFIER_PROMPT
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Optional, Tuple
 
-def is_off_topic(message: str) -> bool:
+import aiohttp
+
+from core.services.deepseek import DeepSeekError, deepseek_client
+from core.utils.config import DEEPSEEK_CLASSIFY_TIMEOUT
+from core.utils.prompt import (
+    SYSTEM_PROMPT,
+    OFF_TOPIC_RESPONSE,
+    AUTO_RELEVANCE_SYSTEM_PROMPT,
+    CONFIRMATION_CLASSIFIER_PROMPT,
+    CONFIRMATION_WITH_SUMMARY_PROMPT,
+    VOICE_FIX_AND_SUMMARY_PROMPT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Какое резюме составляется или уточняется на шаге диалога
+SUMMARY_SUBJECTS = {
+    "problem": "резюме проблемы",
+    "solution": "резюме предложения решения",
+}
+
+async def is_off_topic(message: str) -> bool:
     """
     Определяет, является ли сообщение отвлеченной темой при помощи DeepSeek-классификации.
     Возвращает True, если сообщение НЕ относится к теме авто/регистрации обращения.
@@ -11,29 +33,23 @@ def is_off_topic(message: str) -> bool:
         if not message or not message.strip():
             return False
         # Если API ключ не настроен, не блокируем пользователя
-        if DEEPSEEK_API_KEY == "ваш_deepseek_api_key" or not DEEPSEEK_API_KEY:
+        if not deepseek_client.is_configured():
             return False
         messages = [
             {"role": "system", "content": AUTO_RELEVANCE_SYSTEM_PROMPT},
             {"role": "user", "content": f"Текст: {message}\nОтветь только YES или NO."}
         ]
-        headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-        data = {
-            "model": DEEPSEEK_MODEL,
-            "messages": messages
-        }
-        response = requests.post(API_URL, json=data, headers=headers, timeout=10)
-        if response.ok:
-            raw = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-            label = (raw or "").strip().upper()
+        raw = await deepseek_client.complete(messages, timeout=DEEPSEEK_CLASSIFY_TIMEOUT, call="off_topic")
+        if raw is not None:
+            label = raw.strip().upper()
             is_relevant = label.startswith("YES")
             return not is_relevant
         return False
     except Exception as e:
-        print(f"Ошибка при классификации релевантности: {e}")
+        logger.warning("Ошибка при классификации релевантности: %s", e)
         return False
 
-def ask_ai(user_message: str, history=None, skip_offtopic_check: bool = False) -> str:
+async def ask_ai(user_message: str, history=None, skip_offtopic_check: bool = False) -> str:
     if history is None:
         history = []
     
@@ -46,23 +62,48 @@ def ask_ai(user_message: str, history=None, skip_offtopic_check: bool = False) -
         *history,
         {"role": "user", "content": user_message}
     ]
-    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-    data = {
-        "model": DEEPSEEK_MODEL,
-        "messages": messages
-    }
-    response = requests.post(API_URL, json=data, headers=headers)
-    if response.ok:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "Нет ответа от нейросети.")
-    return "Ошибка при обращении к ИИ-сервису."
+    content = await deepseek_client.complete(messages, call="ask")
+    if content is None:
+        return "Ошибка при обращении к ИИ-сервису."
+    return content or "Нет ответа от нейросети."
 
-def fix_grammar(text: str) -> str:
+async def stream_ai(user_message: str, on_partial: Callable[[str], Awaitable[None]], history=None) -> Optional[str]:
+    """
+    Как ask_ai, но ответ читается потоком: on_partial получает накопленный текст после каждого фрагмента.
+    Возвращает полный текст или None, если поток не удался (тогда можно повторить через ask_ai).
+    """
+    if history is None:
+        history = []
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": user_message}
+    ]
+    text = ""
+    show_partials = True
+    try:
+        async for delta in deepseek_client.stream(messages):
+            text += delta
+            if not show_partials:
+                continue
+            try:
+                await on_partial(text)
+            except Exception as e:
+                # Сбой показа (например, правки в Telegram) не обрывает поток: дочитываем ответ без промежуточного текста
+                logger.warning("Ошибка при показе промежуточного ответа ИИ: %s", e)
+                show_partials = False
+    except Exception as e:
+        logger.warning("Ошибка при потоковом обращении к ИИ: %s", e)
+        return None
+    return text or None
+
+async def fix_grammar(text: str) -> str:
     """
     Исправляет грамматику текста с помощью DeepSeek
     """
     # Проверяем, есть ли API ключ
-    if DEEPSEEK_API_KEY == "ваш_deepseek_api_key" or not DEEPSEEK_API_KEY:
-        print("⚠️ API ключ DeepSeek не настроен. Возвращаю исходный текст.")
+    if not deepseek_client.is_configured():
+        logger.warning("⚠️ API ключ DeepSeek не настроен. Возвращаю исходный текст.")
         return text
     
     prompt = f"""
@@ -86,50 +127,31 @@ def fix_grammar(text: str) -> str:
             {"role": "system", "content": "Ты помощник для исправления грамматических ошибок. Исправляй только грамматику, не меняя смысл."},
             {"role": "user", "content": prompt}
         ]
-        headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-        data = {
-            "model": DEEPSEEK_MODEL,
-            "messages": messages
-        }
-        print(f"🔧 Отправляю запрос к DeepSeek API...")
-        print(f"🔧 URL: {API_URL}")
-        print(f"🔧 Модель: {DEEPSEEK_MODEL}")
-        response = requests.post(API_URL, json=data, headers=headers)
-        print(f"🔧 Статус ответа: {response.status_code}")
+        corrected_text = await deepseek_client.complete(messages, call="fix_grammar")
         
-        if response.ok:
-            response_data = response.json()
-            print(f"🔧 Ответ API: {response_data}")
-            corrected_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", text)
-            return corrected_text.strip()
+        if corrected_text is not None:
+            return corrected_text.strip() or text
         else:
-            print(f"❌ Ошибка при исправлении грамматики: {response.status_code}")
-            print(f"❌ Текст ошибки: {response.text}")
+            logger.warning("❌ Ошибка при исправлении грамматики")
             return text
     except Exception as e:
-        print(f"Ошибка при исправлении грамматики: {e}")
+        logger.warning("Ошибка при исправлении грамматики: %s", e)
         return text 
 
-def classify_confirmation(text: str) -> str:
+async def classify_confirmation(text: str) -> str:
     """Возвращает 'YES', 'NO' или 'UNCLEAR' по ответу пользователя."""
     try:
         if not text or not text.strip():
             return "UNCLEAR"
-        if DEEPSEEK_API_KEY == "ваш_deepseek_api_key" or not DEEPSEEK_API_KEY:
+        if not deepseek_client.is_configured():
             return "UNCLEAR"
         messages = [
             {"role": "system", "content": CONFIRMATION_CLASSIFIER_PROMPT},
             {"role": "user", "content": text}
         ]
-        headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-        data = {
-            "model": DEEPSEEK_MODEL,
-            "messages": messages
-        }
-        response = requests.post(API_URL, json=data, headers=headers, timeout=10)
-        if response.ok:
-            raw = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
-            label = (raw or "").strip().upper()
+        raw = await deepseek_client.complete(messages, timeout=DEEPSEEK_CLASSIFY_TIMEOUT, call="classify_confirmation")
+        if raw is not None:
+            label = raw.strip().upper()
             if label.startswith("YES"):
                 return "YES"
             if label.startswith("NO"):
@@ -137,5 +159,90 @@ def classify_confirmation(text: str) -> str:
             return "UNCLEAR"
         return "UNCLEAR"
     except Exception as e:
-        print(f"Ошибка при классификации подтверждения: {e}")
-        return "UNCLEAR" 
\ No newline at end of file
+        logger.warning("Ошибка при классификации подтверждения: %s", e)
+        return "UNCLEAR"
+
+async def complete_or_raise(messages, **params) -> str:
+    """Как deepseek_client.complete, но ошибка HTTP, сети или таймаут поднимает DeepSeekError"""
+    try:
+        raw = await deepseek_client.complete(messages, **params)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise DeepSeekError(f"DeepSeek недоступен: {e!r}") from e
+    if raw is None:
+        raise DeepSeekError("DeepSeek вернул ошибку")
+    return raw
+
+def parse_json_reply(raw: str) -> Optional[dict]:
+    """Разбирает JSON-объект из ответа модели (в том числе обернутый в блок ```json ... ```)"""
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text.lower().startswith("json"):
+            text = text[4:]
+    try:
+        decision = json.loads(text)
+    except ValueError:
+        return None
+    return decision if isinstance(decision, dict) else None
+
+def parse_confirmation_decision(raw: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Проверяет ответ совмещенного вызова: JSON-объект с label из YES/NO/UNCLEAR
+    и непустым summary для UNCLEAR. Возвращает (label, summary) или None, если схема не совпала.
+    """
+    decision = parse_json_reply(raw)
+    if decision is None:
+        return None
+    label = str(decision.get("label", "")).strip().upper()
+    if label not in ("YES", "NO", "UNCLEAR"):
+        return None
+    if label != "UNCLEAR":
+        return label, None
+    summary = decision.get("summary")
+    if not isinstance(summary, str) or not summary.strip():
+        return None
+    return label, summary.strip().rstrip('?.!')
+
+async def classify_and_update_summary(text: str, summary: str, subject: str = "problem") -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Один запрос вместо двух: классифицирует ответ подтверждения и, если это уточнение,
+    сразу возвращает обновленное резюме. None — если ответ не удалось разобрать
+    (тогда вызывающий код переходит на classify_confirmation + update_*_summary).
+    Если сервис не ответил, поднимается DeepSeekError: повторять запрос еще двумя вызовами незачем.
+    """
+    if not text or not text.strip():
+        return "UNCLEAR", None
+    if not deepseek_client.is_configured():
+        return None
+    messages = [
+        {"role": "system", "content": CONFIRMATION_WITH_SUMMARY_PROMPT.format(subject=SUMMARY_SUBJECTS[subject])},
+        {"role": "user", "content": f"Текущее резюме: {summary}\nОтвет клиента: {text}"}
+    ]
+    raw = await complete_or_raise(
+        messages, timeout=DEEPSEEK_CLASSIFY_TIMEOUT, call="classify_and_summary", response_format={"type": "json_object"}
+    )
+    decision = parse_confirmation_decision(raw)
+    if decision is None:
+        logger.warning("⚠️ Ответ совмещенной классификации не соответствует схеме: %.200s", raw)
+    return decision
+
+async def fix_grammar_and_summarize(text: str, subject: str = "problem") -> Optional[Tuple[str, str]]:
+    """
+    Голосовой конвейер: один запрос возвращает исправленный текст и резюме
+    вместо fix_grammar + create_*_summary. None — если ответ не по схеме (тогда два отдельных запроса);
+    если сервис не ответил, поднимается DeepSeekError.
+    """
+    if not text or not text.strip() or not deepseek_client.is_configured():
+        return None
+    messages = [
+        {"role": "system", "content": VOICE_FIX_AND_SUMMARY_PROMPT.format(subject=SUMMARY_SUBJECTS[subject])},
+        {"role": "user", "content": f"Текст: {text}"}
+    ]
+    raw = await complete_or_raise(messages, call="fix_and_summarize", response_format={"type": "json_object"})
+    reply = parse_json_reply(raw)
+    corrected = reply.get("text") if reply else None
+    summary = reply.get("summary") if reply else None
+    if not isinstance(corrected, str) or not corrected.strip() or not isinstance(summary, str) or not summary.strip():
+        logger.warning("⚠️ Ответ совмещенного исправления не соответствует схеме: %.200s", raw)
+        return None
+    return corrected.strip(), summary.strip().rstrip('?.!')
@@ -0,0 +1,72 @@
+"""
+Реестр моделей Vosk и политика выбора модели под конкретное голосовое сообщение
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Описание модели распознавания: имя уровня качества и путь к каталогу модели"""
+    name: str
+    path: str
+    sample_rate: int = 16000
+
+
+def parse_model_specs(raw: str) -> Dict[str, ModelSpec]:
+    """
+    Разбирает строку вида "small=vosk-model-small-ru;large=vosk-model-ru"
+    в словарь {имя: ModelSpec}; порядок записей сохраняется
+    """
+    specs = {}
+    for item in raw.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, path = item.partition("=")
+        if not path:
+            raise ValueError(f"Ожидалось имя=путь в описании модели: {item!r}")
+        specs[name.strip()] = ModelSpec(name=name.strip(), path=path.strip())
+    return specs
+
+
+# Вид шага диалога, где ожидается короткий ответ «да/нет» — точность большой модели там не нужна
+CONFIRMATION_STEP = "confirmation"
+
+
+class ModelRouter:
+    def __init__(self, default: str, accurate: str, short_seconds: float, max_queued: int):
+        """
+        Политика: короткие ответы и подтверждения — всегда быстрая модель по умолчанию;
+        длинные описания — точная модель, пока в очереди распознавания ждут меньше max_queued записей
+        """
+        self.default = default
+        self.accurate = accurate
+        self.short_seconds = short_seconds
+        self.max_queued = max_queued
+        self.decisions = {}
+
+    def choose(
+        self,
+        duration: Optional[float],
+        queued: int,
+        step: Optional[str],
+        available: Iterable[str],
+    ) -> str:
+        """Выбирает имя модели по длительности аудио, глубине очереди распознавания и виду шага диалога"""
+        if not self.accurate:
+            name, reason = self.default, "accurate_disabled"
+        elif self.accurate not in available:
+            name, reason = self.default, "no_accurate_model"
+        elif step == CONFIRMATION_STEP:
+            name, reason = self.default, "confirmation_step"
+        elif duration is not None and duration <= self.short_seconds:
+            name, reason = self.default, "short_audio"
+        elif queued >= self.max_queued:
+            name, reason = self.default, "under_load"
+        else:
+            name, reason = self.accurate, "long_audio_idle"
+        key = f"{name}:{reason}"
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        return name
@@ -0,0 +1,185 @@
+"""
+Ограниченная очередь задач распознавания речи перед AudioProcessor
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from aiogram.types import Voice
+
+from settings import (
+    ASR_MAX_AUDIO_SECONDS,
+    ASR_QUEUE_MAX_JOBS,
+    ASR_QUEUE_MAX_RUNNING,
+    ASR_QUEUE_AUDIO_SECONDS_BUDGET,
+    ASR_QUEUE_MEMORY_BUDGET_MB,
+)
+
+logger = logging.getLogger(__name__)
+
+# PCM16 16 кГц — 32000 байт в секунду; декодер, VAD и нарезка держат до трех копий
+PCM_BYTES_PER_SECOND = 32000
+PCM_COPIES = 3
+
+
+def estimate_job_bytes(duration: float, file_size: Optional[int]) -> int:
+    """Оценка пиковой памяти задачи: сжатый файл плюс копии декодированного PCM"""
+    return int((file_size or 0) + duration * PCM_BYTES_PER_SECOND * PCM_COPIES)
+
+
+@dataclass
+class AsrJob:
+    """Голосовое сообщение в очереди на распознавание"""
+    duration: float
+    bytes: int
+    granted: asyncio.Future
+    moved: asyncio.Event = field(default_factory=asyncio.Event)
+    position: int = 0
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class AsrQueue:
+    def __init__(
+        self,
+        max_jobs: int = ASR_QUEUE_MAX_JOBS,
+        max_running: int = ASR_QUEUE_MAX_RUNNING,
+        seconds_budget: float = ASR_QUEUE_AUDIO_SECONDS_BUDGET,
+        memory_budget: int = ASR_QUEUE_MEMORY_BUDGET_MB * 1024 * 1024,
+        max_audio_seconds: float = ASR_MAX_AUDIO_SECONDS,
+    ):
+        """
+        Задачи стартуют по порядку поступления, пока выполняющиеся укладываются в лимиты
+        по числу, секундам аудио и оценке памяти (одна задача стартует всегда, даже если больше бюджета).
+        Всего в очереди и в работе не больше max_jobs — сверх этого задачи отклоняются
+        """
+        self.max_jobs = max_jobs
+        self.max_running = max_running
+        self.seconds_budget = seconds_budget
+        self.memory_budget = memory_budget
+        self.max_audio_seconds = max_audio_seconds
+        self._waiting: Deque[AsrJob] = deque()
+        self.running = 0
+        self.running_seconds = 0.0
+        self.running_bytes = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected_full = 0
+        self.rejected_long = 0
+        self.wait_seconds = 0.0
+
+    def precheck(self, voice: Voice) -> Optional[str]:
+        """Проверка до скачивания файла: None — можно ставить в очередь, иначе причина отказа"""
+        if voice.duration and voice.duration > self.max_audio_seconds:
+            self.rejected_long += 1
+            return "too_long"
+        if self.running + len(self._waiting) >= self.max_jobs:
+            self.rejected_full += 1
+            return "queue_full"
+        return None
+
+    def _fits(self, job: AsrJob) -> bool:
+        if self.running == 0:
+            return True
+        return (
+            self.running < self.max_running
+            and self.running_seconds + job.duration <= self.seconds_budget
+            and self.running_bytes + job.bytes <= self.memory_budget
+        )
+
+    def _dispatch(self):
+        """Запускает задачи из головы очереди и сообщает оставшимся их новые позиции"""
+        while self._waiting and self._waiting[0].granted.done():
+            self._waiting.popleft()
+        while self._waiting and self._fits(self._waiting[0]):
+            job = self._waiting.popleft()
+            if job.granted.done():
+                continue
+            self.running += 1
+            self.running_seconds += job.duration
+            self.running_bytes += job.bytes
+            self.admitted += 1
+            self.wait_seconds += time.monotonic() - job.enqueued
+            job.granted.set_result(None)
+        for position, job in enumerate(self._waiting, start=1):
+            if job.position != position:
+                job.position = position
+                job.moved.set()
+
+    def _release(self, job: AsrJob):
+        self.running -= 1
+        self.running_seconds -= job.duration
+        self.running_bytes -= job.bytes
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        duration: float,
+        file_size: Optional[int] = None,
+        on_position: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> AsyncIterator[bool]:
+        """
+        async with asr_queue.slot(...) as admitted: — ждет места для распознавания.
+        Пока задача ждет, on_position получает ее номер в очереди при каждом изменении.
+        admitted = False, если очередь заполнена до предела
+        """
+        if self.running + len(self._waiting) >= self.max_jobs:
+            self.rejected_full += 1
+            yield False
+            return
+        job = AsrJob(duration, estimate_job_bytes(duration, file_size), asyncio.get_running_loop().create_future())
+        self._waiting.append(job)
+        self._dispatch()
+        if not job.granted.done():
+            self.delayed += 1
+        try:
+            while not job.granted.done():
+                if on_position is not None and job.moved.is_set():
+                    job.moved.clear()
+                    try:
+                        await on_position(job.position)
+                    except Exception as e:
+                        logger.warning("⚠️ Не удалось показать место в очереди: %s", e)
+                    continue
+                moved = asyncio.ensure_future(job.moved.wait())
+                try:
+                    await asyncio.wait({job.granted, moved}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    moved.cancel()
+        except asyncio.CancelledError:
+            if job.granted.done() and not job.granted.cancelled():
+                self._release(job)
+            else:
+                job.granted.cancel()
+                self._dispatch()
+            raise
+        try:
+            yield True
+        finally:
+            self._release(job)
+
+    def depth(self) -> int:
+        """Сколько голосовых ждут распознавания (отмененные ожидания не считаются)"""
+        return sum(1 for job in self._waiting if not job.granted.done())
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "waiting": len(self._waiting),
+            "running_audio_seconds": self.running_seconds,
+            "running_bytes_estimate": self.running_bytes,
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected_full": self.rejected_full,
+            "rejected_long": self.rejected_long,
+            "wait_seconds_avg": self.wait_seconds / self.admitted if self.admitted else 0.0,
+        }
+
+
+# Глобальная очередь распознавания
+asr_queue = AsrQueue()
@@ -1,202 +1,934 @@
+import io
 import os
 import json
-import wave
-import tempfile
-from typing import Optional, Tuple
+import logging
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import vosk
 import soundfile as sf
 from aiogram.types import Voice, Audio
 
+from settings import (
+    ASR_WORKERS,
+    ASR_STREAMING,
+    ASR_MAX_AUDIO_SECONDS,
+    ASR_PARTIAL_INTERVAL,
+    ASR_EMPTY_ABORT_SECONDS,
+    ASR_RECOGNIZER_POOL_SIZE,
+    ASR_RECOGNIZER_PREFILL,
+    ASR_MODELS,
+    ASR_DEFAULT_MODEL,
+    ASR_ACCURATE_MODEL,
+    ASR_SHORT_AUDIO_SECONDS,
+    ASR_ACCURATE_MAX_QUEUED,
+    ASR_SEGMENT_MIN_SECONDS,
+    ASR_SEGMENT_SECONDS,
+    ASR_VAD,
+    ASR_VAD_FLOOR_DB,
+    ASR_VAD_CEILING_DB,
+    ASR_VAD_MARGIN_DB,
+    ASR_VAD_MIN_SPEECH_SECONDS,
+    ASR_VAD_MAX_PAUSE_SECONDS,
+    ASR_VAD_PADDING_SECONDS,
+)
+from core.services.asr_models import ModelRouter, parse_model_specs
+from core.services.asr_queue import asr_queue
+from core.services.recognizers import RecognizerPool
+from core.services.metrics import ASR_STAGE_SECONDS, observe_timings
+from core.utils.logs import setup_worker_logging
+from core.utils.opus import decode_ogg_opus, is_ogg_opus, iter_opus_pcm, load_libopus, ogg_opus_duration
+from core.utils.resample import resample_poly
+
+logger = logging.getLogger(__name__)
+
+# 4000 фреймов PCM16 за один вызов AcceptWaveform
+PCM_CHUNK_BYTES = 8000
+
+# Размер блока при потоковой подаче уже декодированного PCM (0.5 с)
+STREAM_BLOCK_BYTES = 16000
+
+# Кадр анализа энергии: 30 мс на 16 кГц
+ENERGY_FRAME_SAMPLES = 480
+
+@dataclass
+class RecognitionResult:
+    """Результат распознавания одной задачи"""
+    text: Optional[str]
+    duration: float  # длительность аудио, секунды
+    peak_bytes: int  # пиковый суммарный объем аудиобуферов задачи
+    recognizer_reused: bool = False  # распознаватель взят из пула
+    recognizer_setup_seconds: float = 0.0  # время получения распознавателя
+    model: str = ""  # имя модели из реестра, которой распознано аудио
+    vad_removed_seconds: float = 0.0  # тишина, вырезанная до распознавания
+    confidences: List[float] = field(default_factory=list)  # уверенность Vosk по каждому слову
+    timings: Dict[str, float] = field(default_factory=dict)  # длительность этапов (decode, resample, vad, recognize), секунды
+
+def to_pcm16(data: np.ndarray) -> bytes:
+    """Преобразует float-сигнал [-1, 1] в байты PCM16"""
+    scaled = np.clip(data, -1.0, 1.0)
+    scaled *= 32767.0
+    return scaled.astype(np.int16).tobytes()
+
+def frame_energy(samples: np.ndarray, frame: int = ENERGY_FRAME_SAMPLES) -> np.ndarray:
+    """Средняя энергия сигнала PCM16 по кадрам (векторно, без цикла по кадрам)"""
+    frames = len(samples) // frame
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    blocks = samples[:frames * frame].reshape(frames, frame).astype(np.float32)
+    return np.einsum("ij,ij->i", blocks, blocks) / frame
+
+def trim_silence(
+    samples: np.ndarray,
+    floor_db: float = ASR_VAD_FLOOR_DB,
+    ceiling_db: float = ASR_VAD_CEILING_DB,
+    margin_db: float = ASR_VAD_MARGIN_DB,
+    min_speech_seconds: float = ASR_VAD_MIN_SPEECH_SECONDS,
+    max_pause_seconds: float = ASR_VAD_MAX_PAUSE_SECONDS,
+    padding_seconds: float = ASR_VAD_PADDING_SECONDS,
+) -> Tuple[np.ndarray, bool]:
+    """
+    Энергетический VAD для PCM16 16 кГц. Порог — выше уровня шума (10-й перцентиль энергии)
+    на margin_db, но в пределах [floor_db, ceiling_db] dBFS — верхняя граница нужна записям,
+    где речь идет без пауз и перцентиль попадает на саму речь. Речевые кадры расширяются на padding_seconds,
+    тишина в начале и конце удаляется, паузы длиннее max_pause_seconds сжимаются до этой длины.
+    Возвращает (обрезанный сигнал, найдена ли речь).
+    """
+    energy = frame_energy(samples)
+    if len(energy) == 0:
+        return samples[:0], False
+    level_db = 10 * np.log10(energy / (32768.0 ** 2) + 1e-12)
+    threshold = min(max(floor_db, float(np.percentile(level_db, 10)) + margin_db), ceiling_db)
+    speech = level_db > threshold
+    
+    frame_seconds = ENERGY_FRAME_SAMPLES / 16000
+    if speech.sum() * frame_seconds < min_speech_seconds:
+        return samples[:0], False
+    
+    # Расширяем речевые участки, чтобы не срезать края слов
+    pad = int(padding_seconds / frame_seconds)
+    if pad:
+        speech = np.convolve(speech, np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+    
+    keep = np.zeros(len(speech), dtype=bool)
+    voiced = np.flatnonzero(speech)
+    first, last = voiced[0], voiced[-1]
+    keep[first:last + 1] = True
+    
+    # Сжимаем длинные паузы: в каждой серии тишины оставляем не больше max_pause кадров
+    max_pause = int(max_pause_seconds / frame_seconds)
+    silent = ~speech & keep
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    for start, end in zip(starts[ends - starts > max_pause], ends[ends - starts > max_pause]):
+        keep[start + max_pause:end] = False
+    
+    frames = samples[:len(keep) * ENERGY_FRAME_SAMPLES].reshape(len(keep), ENERGY_FRAME_SAMPLES)
+    return frames[keep].reshape(-1), True
+
+def find_split_points(samples: np.ndarray, parts: int, search_seconds: float = 3.0) -> List[int]:
+    """
+    Делит PCM16 16 кГц на parts примерно равных частей, сдвигая каждую границу
+    в самую тихую паузу (сглаженная энергия ~300 мс) в пределах ±search_seconds.
+    Возвращает индексы отсчетов-границ по возрастанию.
+    """
+    energy = frame_energy(samples)
+    if parts <= 1 or len(energy) < parts * 2:
+        return []
+    smooth = np.convolve(energy, np.ones(10, dtype=np.float32) / 10, mode="same")
+    radius = int(search_seconds * 16000 / ENERGY_FRAME_SAMPLES)
+    bounds = []
+    previous = 0
+    for k in range(1, parts):
+        target = k * len(smooth) // parts
+        lo = max(previous + 1, target - radius)
+        hi = min(len(smooth) - 1, target + radius)
+        if lo >= hi:
+            continue
+        quietest = lo + int(np.argmin(smooth[lo:hi]))
+        bounds.append(quietest * ENERGY_FRAME_SAMPLES + ENERGY_FRAME_SAMPLES // 2)
+        previous = quietest
+    return bounds
+
 class AudioProcessor:
-    def __init__(self):
-        """Инициализация процессора аудио с Vosk моделью"""
-        self.model_path = "vosk-model-small-ru"
-        self.model = None
-        self.initialize_model()
-    
-    def initialize_model(self):
-        """Инициализация модели Vosk"""
+    def __init__(self, workers: int = ASR_WORKERS, streaming: bool = ASR_STREAMING):
+        """
+        Инициализация процессора аудио. Модель Vosk не загружается при импорте:
+        start() загружает и прогревает ее в фоне, пока бот уже отвечает на текст
+        """
+        # Реестр моделей: модель по умолчанию (быстрая) и, при наличии, более точные
+        self.model_specs = parse_model_specs(ASR_MODELS)
+        self.default_model = ASR_DEFAULT_MODEL
+        self.model_path = self.model_specs[self.default_model].path
+        self.model = None  # модель по умолчанию
+        self.models: Dict[str, vosk.Model] = {}
+        self.pools: Dict[str, RecognizerPool] = {}
+        self.router = ModelRouter(
+            default=ASR_DEFAULT_MODEL,
+            accurate=ASR_ACCURATE_MODEL,
+            short_seconds=ASR_SHORT_AUDIO_SECONDS,
+            max_queued=ASR_ACCURATE_MAX_QUEUED,
+        )
+        # Задачи распознавания в работе (учитываются политикой выбора модели)
+        self.busy = 0
+        self.streaming = streaming
+        self.recognizers: Optional[RecognizerPool] = None
+        # Сводка по пулам распознавателей всех процессов (собирается из результатов задач)
+        self.recognizer_usage = {"jobs": 0, "reused": 0, "setup_seconds": 0.0}
+        # Сводка VAD: сколько аудио пришло, сколько вырезано и сколько записей оказались тишиной
+        self.vad_usage = {"jobs": 0, "silent": 0, "input_seconds": 0.0, "removed_seconds": 0.0}
+        self.vad_enabled = ASR_VAD
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._stream_executor: Optional[ThreadPoolExecutor] = None
+        self._workers_ready = False
+        self._startup_task: Optional[asyncio.Task] = None
+        # Причина, по которой запуск распознавания не удался (None — запуск идет или прошел успешно)
+        self.startup_error: Optional[str] = None
+        # Длительность фаз запуска распознавания, секунды
+        self.startup_timings = {}
+    
+    def initialize_model(self, download: bool = True):
+        """Инициализация модели Vosk (download=False — не скачивать, если модели нет на диске)"""
         try:
             # Проверяем, есть ли уже скачанная модель
             if os.path.exists(self.model_path):
-                self.model = vosk.Model(self.model_path)
-                print(f"Модель Vosk загружена из {self.model_path}")
+                phase = time.perf_counter()
+                model = vosk.Model(self.model_path)
+                self.startup_timings["model_read"] = time.perf_counter() - phase
+                logger.info("Модель Vosk загружена из %s", self.model_path)
+                self.register_model(self.default_model, model)
+            elif not download:
+                logger.error("❌ Модель Vosk не найдена в %s", self.model_path)
             else:
-                print("Модель Vosk не найдена. Скачиваем...")
+                logger.warning("Модель Vosk не найдена. Скачиваем...")
+                phase = time.perf_counter()
                 self.download_model()
+                self.startup_timings["model_download"] = time.perf_counter() - phase
         except Exception as e:
-            print(f"Ошибка при инициализации модели Vosk: {e}")
+            logger.exception("Ошибка при инициализации модели Vosk: %s", e)
+        self.load_additional_models()
     
-    def download_model(self):
-        """Скачивание модели Vosk для русского языка"""
+    def load_additional_models(self):
+        """Загружает остальные модели реестра, каталоги которых есть на диске"""
+        for name, spec in self.model_specs.items():
+            if name == self.default_model or name in self.models:
+                continue
+            if not os.path.exists(spec.path):
+                logger.warning("⚠️ Модель '%s' не найдена в %s, используется '%s'", name, spec.path, self.default_model)
+                continue
+            try:
+                phase = time.perf_counter()
+                model = vosk.Model(spec.path)
+                self.startup_timings[f"model_read_{name}"] = time.perf_counter() - phase
+                logger.info("Модель Vosk '%s' загружена из %s", name, spec.path)
+                self.register_model(name, model)
+            except Exception as e:
+                logger.exception("Ошибка при загрузке модели '%s': %s", name, e)
+    
+    def register_model(self, name: str, model):
+        """Регистрирует загруженную модель и создает для нее пул распознавателей"""
+        self.models[name] = model
+        self.create_recognizer_pool(name)
+        if name == self.default_model:
+            self.model = model
+            self.recognizers = self.pools[name]
+    
+    def download_model_files(self):
+        """
+        Скачивает и распаковывает модель Vosk для русского языка во временный каталог
+        и переносит ее в model_path одним rename — незаконченная распаковка не выглядит готовой моделью
+        """
+        import shutil
+        import tempfile
         import urllib.request
         import zipfile
         
         model_url = "https://alphacephei.com/vosk/models/vosk-model-small-ru-0.22.zip"
-        zip_path = "vosk-model-small-ru.zip"
-        
+        parent = os.path.dirname(os.path.abspath(self.model_path))
+        workdir = tempfile.mkdtemp(prefix=".vosk-download-", dir=parent)
         try:
-            print("Скачивание модели Vosk...")
+            zip_path = os.path.join(workdir, "vosk-model-small-ru.zip")
+            logger.info("Скачивание модели Vosk...")
             urllib.request.urlretrieve(model_url, zip_path)
             
-            print("Распаковка модели...")
+            logger.info("Распаковка модели...")
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(".")
-            
-            # Переименовываем папку
-            if os.path.exists("vosk-model-small-ru-0.22"):
-                os.rename("vosk-model-small-ru-0.22", self.model_path)
+                zip_ref.extractall(workdir)
             
-            # Удаляем zip файл
-            os.remove(zip_path)
+            os.rename(os.path.join(workdir, "vosk-model-small-ru-0.22"), self.model_path)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    def download_model(self):
+        """Скачивание модели Vosk для русского языка и ее загрузка"""
+        try:
+            self.download_model_files()
+            self.register_model(self.default_model, vosk.Model(self.model_path))
+            logger.info("Модель Vosk успешно загружена!")
+        except Exception as e:
+            logger.exception("Ошибка при скачивании модели: %s", e)
+    
+    def uses_process_pool(self) -> bool:
+        """Распознавание идет в процессах-воркерах (иначе — в потоках этого процесса)"""
+        return not self.streaming and self.workers > 0
+    
+    def start(self) -> asyncio.Task:
+        """Запускает фоновую загрузку и прогрев модели; не блокирует event loop"""
+        if self._startup_task is None:
+            if self.streaming and self.workers > 0:
+                logger.warning(
+                    "⚠️ ASR_STREAMING включен: распознавание идет в потоках основного процесса, "
+                    "пул из %d процессов (ASR_WORKERS) не используется", self.workers,
+                )
+            self._startup_task = asyncio.create_task(self._load_and_warm_up())
+        return self._startup_task
+    
+    async def _load_and_warm_up(self):
+        """Фоновый запуск распознавания с замером каждой фазы"""
+        started = time.perf_counter()
+        try:
+            if self.uses_process_pool():
+                if not os.path.exists(self.model_path):
+                    # Скачиваем один раз до запуска пула: воркеры, скачивающие одновременно, испортили бы модель
+                    phase = time.perf_counter()
+                    await asyncio.to_thread(self.download_model_files)
+                    self.startup_timings["model_download"] = time.perf_counter() - phase
+                # Каждый воркер загружает модель в initializer и прогревается своей задачей
+                phase = time.perf_counter()
+                loop = asyncio.get_running_loop()
+                executor = self.get_executor()
+                worker_warmups = await asyncio.gather(*[
+                    loop.run_in_executor(executor, _warm_up_in_worker) for _ in range(self.workers)
+                ], return_exceptions=True)
+                self.startup_timings["workers_load_and_warm_up"] = time.perf_counter() - phase
+                failures = [result for result in worker_warmups if isinstance(result, BaseException)]
+                if failures:
+                    # Воркер без модели проваливал бы каждую доставшуюся ему задачу
+                    raise RuntimeError(f"не запустились {len(failures)} из {self.workers} воркеров: {failures[0]}")
+                self.startup_timings["worker_warm_up_max"] = max(worker_warmups)
+                self._workers_ready = True
+            else:
+                phase = time.perf_counter()
+                await asyncio.to_thread(self.initialize_model)
+                self.startup_timings["model_load"] = time.perf_counter() - phase
+                if self.model is None:
+                    raise RuntimeError(f"модель Vosk не загрузилась из {self.model_path}")
+                
+                phase = time.perf_counter()
+                await asyncio.to_thread(self.warm_up)
+                self.startup_timings["warm_up"] = time.perf_counter() - phase
+        except Exception as e:
+            self.startup_error = str(e)
+            logger.exception("❌ Ошибка при фоновом запуске распознавания: %s", e)
+        finally:
+            self.startup_timings["total"] = time.perf_counter() - started
+            report = ", ".join(f"{name} {seconds:.2f} с" for name, seconds in self.startup_timings.items())
+            logger.info(
+                "⏱ Запуск распознавания речи: %s; готово: %s", report, self.is_model_ready(),
+                extra={"startup_timings": dict(self.startup_timings)},
+            )
+    
+    def warm_up(self) -> float:
+        """Прогрев: загрузка libopus, фильтры ресемплера и пробное распознавание секунды тишины"""
+        started = time.perf_counter()
+        load_libopus()
+        for rate in (48000, 44100, 22050, 8000):
+            resample_poly(np.zeros(rate // 10, dtype=np.float32), rate, 16000)
+        for name in self.models:
+            self.decode_pcm(bytes(32000), name)
+        return time.perf_counter() - started
+    
+    def create_recognizer_pool(self, name: str):
+        """Создает пул распознавателей для загруженной модели и прогревает его"""
+        phase = time.perf_counter()
+        spec = self.model_specs[name]
+        pool = RecognizerPool(self.models[name], spec.sample_rate, ASR_RECOGNIZER_POOL_SIZE)
+        pool.prefill(ASR_RECOGNIZER_PREFILL)
+        self.pools[name] = pool
+        self.startup_timings[f"recognizer_prefill_{name}"] = time.perf_counter() - phase
+    
+    def get_pool(self, name: Optional[str]) -> RecognizerPool:
+        """Пул распознавателей модели name (или модели по умолчанию, если она не загружена)"""
+        return self.pools.get(name) or self.recognizers
+    
+    def available_models(self) -> List[str]:
+        """Модели, доступные для распознавания (в режиме воркеров — по наличию каталога)"""
+        if self.uses_process_pool():
+            return [name for name, spec in self.model_specs.items() if os.path.exists(spec.path)]
+        return list(self.models)
+    
+    def choose_model(self, duration: Optional[float], step: Optional[str]) -> str:
+        """Выбор уровня качества по длительности, очереди распознавания и виду шага диалога"""
+        queued = asr_queue.depth()
+        name = self.router.choose(duration, queued, step, self.available_models())
+        logger.debug("🎤 Модель для распознавания: '%s' (длительность %s с, в очереди %s)", name, duration, queued)
+        return name
+    
+    def account_result(self, result: RecognitionResult):
+        """Учитывает пул распознавателей, работу VAD и длительность этапов (задачи могли выполняться в других процессах)"""
+        self.recognizer_usage["jobs"] += 1
+        self.recognizer_usage["reused"] += int(result.recognizer_reused)
+        self.recognizer_usage["setup_seconds"] += result.recognizer_setup_seconds
+        observe_timings(ASR_STAGE_SECONDS, result.timings)
+        if self.vad_enabled:
+            self.vad_usage["jobs"] += 1
+            self.vad_usage["input_seconds"] += result.duration
+            self.vad_usage["removed_seconds"] += result.vad_removed_seconds
+            if result.text is None and result.vad_removed_seconds >= result.duration:
+                self.vad_usage["silent"] += 1
+    
+    def vad_stats(self) -> dict:
+        """Сколько аудио VAD убрал до распознавания"""
+        usage = self.vad_usage
+        return {
+            **usage,
+            "removed_ratio": usage["removed_seconds"] / usage["input_seconds"] if usage["input_seconds"] else 0.0,
+        }
+    
+    def apply_vad(self, pcm: bytes, timings: Optional[Dict[str, float]] = None) -> Tuple[bytes, float]:
+        """Обрезает тишину в PCM16; возвращает (pcm речи или b'' для тишины, вырезано секунд)"""
+        if not self.vad_enabled:
+            return pcm, 0.0
+        started = time.perf_counter()
+        trimmed, has_speech = trim_silence(np.frombuffer(pcm, dtype=np.int16))
+        if timings is not None:
+            timings["vad"] = time.perf_counter() - started
+        kept = trimmed.tobytes() if has_speech else b""
+        removed = (len(pcm) - len(kept)) / 32000
+        logger.debug("🔇 VAD: вырезано %.1f из %.1f с, речь найдена: %s", removed, len(pcm) / 32000, has_speech)
+        return kept, removed
+    
+    def recognizer_stats(self) -> dict:
+        """Попадания/промахи пула распознавателей и время их построения по всем задачам"""
+        usage = self.recognizer_usage
+        jobs = usage["jobs"]
+        misses = jobs - usage["reused"]
+        return {
+            "jobs": jobs,
+            "hits": usage["reused"],
+            "misses": misses,
+            "hit_ratio": usage["reused"] / jobs if jobs else 0.0,
+            "setup_seconds_total": usage["setup_seconds"],
+            "setup_seconds_avg": usage["setup_seconds"] / jobs if jobs else 0.0,
+        }
+    
+    async def process_voice_message(
+        self, voice: Voice, bot, step: Optional[str] = None
+    ) -> Optional[RecognitionResult]:
+        """Обработка голосового сообщения и извлечение текста (вместе с уверенностью по словам)"""
+        model_name = self.choose_model(voice.duration, step)
+        self.busy += 1
+        try:
+            voice_bytes = await self.download_voice(voice, bot)
             
-            self.model = vosk.Model(self.model_path)
-            print("Модель Vosk успешно загружена!")
+            # Декодируем и распознаем вне event loop, без временных файлов
+            if self.should_segment(voice.duration):
+                result = await self.recognize_segmented(voice_bytes, model_name)
+            else:
+                result = await self.run_recognition(voice_bytes, model_name)
+            if result is None:
+                return None
+            self.account_result(result)
+            logger.debug(
+                "🎤 Аудио %.1f с, пик памяти задачи %.1f МБ", result.duration, result.peak_bytes / 1024 / 1024
+            )
+            return result
             
         except Exception as e:
-            print(f"Ошибка при скачивании модели: {e}")
+            logger.exception("❌ Ошибка при обработке голосового сообщения: %s", e)
+            return None
+        finally:
+            self.busy -= 1
     
-    async def process_voice_message(self, voice: Voice, bot) -> Optional[str]:
-        """Обработка голосового сообщения и извлечение текста"""
+    async def stream_voice_message(
+        self,
+        voice: Voice,
+        bot,
+        on_partial: Callable[[str], Awaitable[None]],
+        step: Optional[str] = None,
+        interval: float = ASR_PARTIAL_INTERVAL,
+    ) -> Optional[RecognitionResult]:
+        """
+        Потоковое распознавание: PCM подается в распознаватель по мере декодирования,
+        а промежуточный текст не чаще раза в interval секунд передается в on_partial
+        """
+        model_name = self.choose_model(voice.duration, step)
+        self.busy += 1
         try:
-            print("🎤 Начинаю обработку голосового сообщения в AudioProcessor")
-            print(f"🎤 Модель Vosk готова: {self.model is not None}")
-            if self.model:
-                print(f"🎤 Путь к модели: {self.model_path}")
-            # Скачиваем голосовое сообщение
-            print("🎤 Скачиваю голосовое сообщение...")
-            voice_file = await bot.get_file(voice.file_id)
-            voice_bytes = await bot.download_file(voice_file.file_path)
-            voice_bytes = voice_bytes.read()
-            print(f"🎤 Скачано {len(voice_bytes)} байт")
+            voice_bytes = await self.download_voice(voice, bot)
             
-            # Сохраняем во временный файл
-            print("🎤 Сохраняю во временный файл...")
-            with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_file:
-                temp_file.write(voice_bytes)
-                temp_path = temp_file.name
-            print(f"🎤 Временный файл: {temp_path}")
+            latest = {"text": ""}
             
-            # Конвертируем в WAV и распознаем
-            print("🎤 Конвертирую и распознаю...")
-            text = self.convert_and_recognize(temp_path)
+            def push_partial(text: str):
+                # Вызывается из потока распознавания; присваивание атомарно
+                latest["text"] = text
             
-            # Удаляем временный файл
-            print("🎤 Удаляю временный файл...")
-            os.unlink(temp_path)
+            loop = asyncio.get_running_loop()
+            if self.should_segment(voice.duration):
+                # Длинные записи распознаем частями параллельно; показываем готовое начало текста
+                future = asyncio.ensure_future(self.recognize_segmented(voice_bytes, model_name, push_partial))
+            else:
+                future = loop.run_in_executor(
+                    self.get_stream_executor(), self.recognize_stream, voice_bytes, push_partial, model_name
+                )
+            shown = ""
+            while not future.done():
+                await asyncio.wait({future}, timeout=interval)
+                text = latest["text"]
+                if text and text != shown and not future.done():
+                    shown = text
+                    try:
+                        await on_partial(text)
+                    except Exception as e:
+                        logger.warning("⚠️ Не удалось показать промежуточный текст: %s", e)
             
-            return text
+            result = future.result()
+            if result is None:
+                return None
+            self.account_result(result)
+            logger.debug(
+                "🎤 Аудио %.1f с, пик памяти задачи %.1f МБ", result.duration, result.peak_bytes / 1024 / 1024
+            )
+            return result
             
         except Exception as e:
-            print(f"❌ Ошибка при обработке голосового сообщения: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка при потоковой обработке голосового сообщения: %s", e)
             return None
+        finally:
+            self.busy -= 1
     
-    def convert_and_recognize(self, audio_path: str) -> Optional[str]:
-        """Конвертация аудио в WAV и распознавание речи"""
+    def should_segment(self, duration: Optional[float]) -> bool:
+        """Длинные записи выгодно делить по паузам, если есть больше одного воркера"""
+        return self.workers > 1 and duration is not None and duration >= ASR_SEGMENT_MIN_SECONDS
+    
+    async def recognize_segmented(
+        self,
+        audio_bytes: bytes,
+        model_name: Optional[str] = None,
+        on_partial: Optional[Callable[[str], None]] = None,
+    ) -> Optional[RecognitionResult]:
+        """
+        Декодирует запись, режет ее по паузам на части и распознает их параллельно
+        (в пуле процессов или в потоках). Тексты склеиваются по порядку; границы проходят
+        по паузам, поэтому слова не разрываются. on_partial получает готовое начало текста.
+        """
+        timings: Dict[str, float] = {}
+        converted = await asyncio.to_thread(self.convert_to_pcm, audio_bytes, timings)
+        if converted is None:
+            return None
+        pcm, duration, peak_bytes = converted
+        pcm, removed = await asyncio.to_thread(self.apply_vad, pcm, timings)
+        if not pcm:
+            return RecognitionResult(
+                text=None, duration=duration, peak_bytes=peak_bytes, vad_removed_seconds=removed, timings=timings
+            )
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        parts = max(1, min(self.workers, int(len(samples) / 16000 // ASR_SEGMENT_SECONDS)))
+        bounds = find_split_points(samples, parts)
+        edges = [0, *bounds, len(samples)]
+        segments = [pcm[start * 2:end * 2] for start, end in zip(edges, edges[1:])]
+        logger.debug("🎤 Запись %.1f с разделена на %d частей по паузам", duration, len(segments))
+        
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        if self.uses_process_pool():
+            futures = [
+                loop.run_in_executor(self.get_executor(), _recognize_pcm_in_worker, segment, model_name)
+                for segment in segments
+            ]
+        else:
+            futures = [
+                loop.run_in_executor(self.get_stream_executor(), self.recognize_pcm, segment, model_name)
+                for segment in segments
+            ]
+        
+        async def indexed(index: int, future):
+            return index, await future
+        
+        results: List[Optional[RecognitionResult]] = [None] * len(futures)
+        finished = [False] * len(futures)
+        for next_done in asyncio.as_completed([indexed(i, f) for i, f in enumerate(futures)]):
+            index, result = await next_done
+            results[index] = result
+            finished[index] = True
+            if on_partial is not None:
+                ready = finished.index(False) if False in finished else len(finished)
+                prefix = " ".join(r.text for r in results[:ready] if r is not None and r.text)
+                if prefix:
+                    on_partial(prefix)
+        
+        # Части распознаются параллельно, поэтому этап распознавания — по времени ожидания всех частей
+        timings["recognize"] = time.perf_counter() - started
+        done = [r for r in results if r is not None]
+        text = " ".join(r.text for r in done if r.text).strip()
+        return RecognitionResult(
+            text=text or None,
+            duration=duration,
+            # Исходник, PCM и его нарезка на части одновременно в памяти
+            peak_bytes=max(peak_bytes, len(audio_bytes) + 2 * len(pcm)),
+            recognizer_reused=bool(done) and all(r.recognizer_reused for r in done),
+            recognizer_setup_seconds=sum(r.recognizer_setup_seconds for r in done),
+            model=model_name or self.default_model,
+            vad_removed_seconds=removed,
+            confidences=[conf for r in done for conf in r.confidences],
+            timings=timings,
+        )
+    
+    async def download_voice(self, voice: Voice, bot) -> bytes:
+        """Скачивает голосовое сообщение сразу в память"""
+        with ASR_STAGE_SECONDS.time(stage="download"):
+            voice_file = await bot.get_file(voice.file_id)
+            buffer = io.BytesIO()
+            await bot.download_file(voice_file.file_path, destination=buffer)
+        voice_bytes = buffer.getvalue()
+        logger.debug("🎤 Скачано %d байт", len(voice_bytes))
+        return voice_bytes
+    
+    def get_stream_executor(self) -> ThreadPoolExecutor:
+        """
+        Потоки для потокового распознавания: Vosk вызывается через cffi и отпускает GIL,
+        поэтому декодирование параллелится по ядрам, а колбэки остаются в этом процессе
+        """
+        if self._stream_executor is None:
+            self._stream_executor = ThreadPoolExecutor(
+                max_workers=max(1, self.workers), thread_name_prefix="asr-stream"
+            )
+        return self._stream_executor
+    
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Пул процессов распознавания; каждый воркер один раз загружает модель Vosk"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            logger.info("🎤 Запущен пул распознавания: %d процессов", self.workers)
+        return self._executor
+    
+    async def run_recognition(
+        self, audio_bytes: bytes, model_name: Optional[str] = None
+    ) -> Optional[RecognitionResult]:
+        """Запускает convert_and_recognize в пуле процессов (или в потоке, если воркеров 0)"""
+        if self.workers <= 0:
+            return await asyncio.to_thread(self.convert_and_recognize, audio_bytes, model_name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), _recognize_in_worker, audio_bytes, model_name)
+    
+    def shutdown(self):
+        """Останавливает пул процессов распознавания"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._stream_executor is not None:
+            self._stream_executor.shutdown(wait=False, cancel_futures=True)
+            self._stream_executor = None
+    
+    def convert_and_recognize(
+        self, audio_bytes: bytes, model_name: Optional[str] = None
+    ) -> Optional[RecognitionResult]:
+        """Декодирование аудио в PCM16 в памяти и распознавание речи"""
         try:
-            print("🎤 Начинаю конвертацию и распознавание...")
-            # Конвертируем OGG в WAV
-            wav_path = self.convert_to_wav(audio_path)
+            if not self.model:
+                logger.error("❌ Модель Vosk не инициализирована")
+                return None
+            timings: Dict[str, float] = {}
+            converted = self.convert_to_pcm(audio_bytes, timings)
             
-            if not wav_path:
-                print("❌ Не удалось конвертировать в WAV")
+            if converted is None:
+                logger.warning("❌ Не удалось декодировать аудио")
                 return None
             
-            print(f"✅ WAV файл создан: {wav_path}")
+            pcm, duration, peak_bytes = converted
             
-            # Распознаем речь
-            print("🎤 Начинаю распознавание речи...")
-            text = self.recognize_speech(wav_path)
-            print(f"🎤 Результат распознавания: '{text}'")
+            # Тишину убираем до распознавания; запись без речи в распознаватель не попадает
+            pcm, removed = self.apply_vad(pcm, timings)
+            if not pcm:
+                return RecognitionResult(
+                    text=None, duration=duration, peak_bytes=peak_bytes, vad_removed_seconds=removed, timings=timings
+                )
             
-            # Удаляем временный WAV файл
-            os.unlink(wav_path)
-            print("✅ Временный WAV файл удален")
+            # Распознаем речь
+            started = time.perf_counter()
+            text, confidences, reused, setup_seconds = self.decode_pcm(pcm, model_name)
+            timings["recognize"] = time.perf_counter() - started
             
-            return text
+            return RecognitionResult(
+                text=text,
+                duration=duration,
+                peak_bytes=peak_bytes,
+                recognizer_reused=reused,
+                recognizer_setup_seconds=setup_seconds,
+                model=model_name or self.default_model,
+                vad_removed_seconds=removed,
+                confidences=confidences,
+                timings=timings,
+            )
             
         except Exception as e:
-            print(f"❌ Ошибка при конвертации и распознавании: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка при конвертации и распознавании: %s", e)
             return None
     
-    def convert_to_wav(self, audio_path: str) -> Optional[str]:
-        """Конвертация аудио файла в WAV формат"""
+    def convert_to_pcm(
+        self, audio_bytes: bytes, timings: Optional[Dict[str, float]] = None
+    ) -> Optional[Tuple[bytes, float, int]]:
+        """
+        Декодирует аудио из буфера в моно PCM16 16 кГц.
+        Возвращает (pcm, длительность в секундах, пиковый объем буферов задачи в байтах).
+        В timings, если передан, записывается длительность декодирования и ресемплинга.
+        """
+        timings = timings if timings is not None else {}
         try:
-            print(f"🎤 Конвертирую файл: {audio_path}")
-            # Читаем аудио файл
-            data, samplerate = sf.read(audio_path)
-            print(f"🎤 Аудио данные: {len(data)} сэмплов, частота: {samplerate} Hz")
+            if not self.check_duration(audio_bytes):
+                return None
             
-            # Создаем временный WAV файл
-            wav_path = audio_path.replace('.ogg', '.wav')
-            print(f"🎤 WAV путь: {wav_path}")
+            # Голосовые Telegram (Ogg/Opus) декодируем libopus сразу в 16 кГц, без ресемплинга
+            started = time.perf_counter()
+            native = decode_ogg_opus(audio_bytes, 16000)
+            if native is not None:
+                timings["decode"] = time.perf_counter() - started
+                pcm = native.tobytes()
+                return pcm, len(native) / 16000, len(audio_bytes) + native.nbytes + len(pcm)
+            
+            # Остальные форматы: декодируем сразу во float32 (вдвое меньше float64 по умолчанию)
+            data, samplerate = sf.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=False)
+            if data.ndim > 1:
+                data = data.mean(axis=1, dtype=np.float32)
+            timings["decode"] = time.perf_counter() - started
+            logger.debug("🎤 Аудио данные: %d сэмплов, частота: %d Hz", len(data), samplerate)
+            peak_bytes = len(audio_bytes) + data.nbytes
             
             # Конвертируем в 16kHz для Vosk
             if samplerate != 16000:
-                print(f"🎤 Конвертирую частоту с {samplerate} Hz в 16000 Hz")
-                import librosa
-                data = librosa.resample(data, orig_sr=samplerate, target_sr=16000)
-                samplerate = 16000
-            
-            # Сохраняем как WAV
-            sf.write(wav_path, data, samplerate, subtype='PCM_16')
-            print("✅ WAV файл сохранен с частотой 16kHz")
+                started = time.perf_counter()
+                resampled = resample_poly(data, samplerate, 16000)
+                timings["resample"] = time.perf_counter() - started
+                peak_bytes = max(peak_bytes, len(audio_bytes) + data.nbytes + resampled.nbytes)
+                data = resampled
             
-            return wav_path
+            pcm = to_pcm16(data)
+            peak_bytes = max(peak_bytes, len(audio_bytes) + data.nbytes + len(pcm))
+            return pcm, len(data) / 16000, peak_bytes
             
         except Exception as e:
-            print(f"❌ Ошибка при конвертации в WAV: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка при декодировании аудио: %s", e)
             return None
     
-    def recognize_speech(self, wav_path: str) -> Optional[str]:
-        """Распознавание речи из WAV файла"""
+    def check_duration(self, audio_bytes: bytes) -> bool:
+        """
+        Проверяет длительность, не декодируя аудио целиком. Ogg/Opus — по granule последней страницы,
+        без libsndfile (ему нужна сборка с поддержкой Opus); остальные форматы — по заголовку через soundfile
+        """
+        duration = None
+        if is_ogg_opus(audio_bytes):
+            try:
+                duration = ogg_opus_duration(audio_bytes)
+            except ValueError as e:
+                logger.warning("⚠️ Не удалось прочитать длительность Ogg/Opus: %s", e)
+        if duration is None:
+            duration = sf.info(io.BytesIO(audio_bytes)).duration
+        if duration > ASR_MAX_AUDIO_SECONDS:
+            logger.warning("❌ Аудио слишком длинное: %.1f с (лимит %s с)", duration, ASR_MAX_AUDIO_SECONDS)
+            return False
+        return True
+    
+    def iter_pcm_blocks(self, audio_bytes: bytes) -> Iterator[bytes]:
+        """Отдает PCM16 16 кГц блоками по мере декодирования (Opus — постранично)"""
+        if is_ogg_opus(audio_bytes) and load_libopus() is not None:
+            for block in iter_opus_pcm(audio_bytes, 16000):
+                yield block.tobytes()
+            return
+        converted = self.convert_to_pcm(audio_bytes)
+        if converted is None:
+            return
+        pcm = converted[0]
+        for offset in range(0, len(pcm), STREAM_BLOCK_BYTES):
+            yield pcm[offset:offset + STREAM_BLOCK_BYTES]
+    
+    def recognize_stream(
+        self,
+        audio_bytes: bytes,
+        on_partial: Callable[[str], None],
+        model_name: Optional[str] = None,
+        empty_abort_seconds: float = ASR_EMPTY_ABORT_SECONDS,
+    ) -> Optional[RecognitionResult]:
+        """
+        Потоковое распознавание в текущем потоке. После каждого блока сообщает текущий текст
+        (готовые фразы + PartialResult) и прерывается, если за empty_abort_seconds речи не найдено.
+        """
         try:
             if not self.model:
-                print("❌ Модель Vosk не инициализирована")
+                logger.error("❌ Модель Vosk не инициализирована")
+                return None
+            if not self.check_duration(audio_bytes):
                 return None
             
-            print("✅ Модель Vosk готова")
-            
-            # Создаем распознаватель
-            rec = vosk.KaldiRecognizer(self.model, 16000)
-            print("✅ Распознаватель создан")
+            # С VAD запись декодируется целиком (это быстро), тишина вырезается, а в распознаватель
+            # блоками идет только речь; без VAD блоки отдаются по мере декодирования
+            removed = 0.0
+            duration = None
+            peak_bytes = None
+            timings: Dict[str, float] = {}
+            if self.vad_enabled:
+                converted = self.convert_to_pcm(audio_bytes, timings)
+                if converted is None:
+                    return None
+                pcm, duration, peak_bytes = converted
+                pcm, removed = self.apply_vad(pcm, timings)
+                if not pcm:
+                    return RecognitionResult(
+                        text=None, duration=duration, peak_bytes=peak_bytes, vad_removed_seconds=removed, timings=timings
+                    )
+                blocks = (pcm[offset:offset + STREAM_BLOCK_BYTES] for offset in range(0, len(pcm), STREAM_BLOCK_BYTES))
+            else:
+                blocks = self.iter_pcm_blocks(audio_bytes)
             
-            # Читаем WAV файл
-            print("🎤 Читаю WAV файл...")
-            with wave.open(wav_path, 'rb') as wf:
-                frames_count = 0
-                while True:
-                    data = wf.readframes(4000)
-                    if len(data) == 0:
+            started = time.perf_counter()
+            with self.get_pool(model_name).recognizer() as (rec, reused):
+                setup_seconds = time.perf_counter() - started
+                segments: List[str] = []
+                confidences: List[float] = []
+                fed_bytes = 0
+                max_block = 0
+                aborted = False
+                for block in blocks:
+                    self._feed_recognizer(rec, block, segments, confidences)
+                    fed_bytes += len(block)
+                    max_block = max(max_block, len(block))
+                    partial = json.loads(rec.PartialResult()).get("partial", "").strip()
+                    text = " ".join(segments + ([partial] if partial else []))
+                    if text:
+                        on_partial(text)
+                    elif empty_abort_seconds and fed_bytes / 32000 >= empty_abort_seconds:
+                        logger.info("🎤 За %.0f с речи не найдено, прерываю распознавание", empty_abort_seconds)
+                        aborted = True
                         break
-                    rec.AcceptWaveform(data)
-                    frames_count += 1
-                print(f"🎤 Обработано {frames_count} фреймов")
+                
+                if not aborted:
+                    self._take_result(json.loads(rec.FinalResult()), segments, confidences)
+            # Без VAD декодирование идет вперемешку с распознаванием и входит в этот этап
+            timings["recognize"] = time.perf_counter() - started
+            text = " ".join(segments).strip()
+            # Без VAD одновременно в памяти только исходный файл и один декодированный блок
+            return RecognitionResult(
+                text=text or None,
+                duration=duration if duration is not None else fed_bytes / 32000,
+                peak_bytes=peak_bytes or len(audio_bytes) + 2 * max_block,
+                recognizer_reused=reused,
+                recognizer_setup_seconds=setup_seconds,
+                model=model_name or self.default_model,
+                vad_removed_seconds=removed,
+                confidences=confidences,
+                timings=timings,
+            )
+            
+        except Exception as e:
+            logger.exception("❌ Ошибка при потоковом распознавании речи: %s", e)
+            return None
+    
+    def _feed_recognizer(self, rec, pcm: bytes, segments: List[str], confidences: List[float]):
+        """
+        Подает PCM в распознаватель. Когда Vosk завершает фразу (AcceptWaveform -> True),
+        ее текст нужно забрать через Result(), иначе FinalResult вернет только последнюю фразу.
+        """
+        for offset in range(0, len(pcm), PCM_CHUNK_BYTES):
+            if rec.AcceptWaveform(pcm[offset:offset + PCM_CHUNK_BYTES]):
+                self._take_result(json.loads(rec.Result()), segments, confidences)
+    
+    @staticmethod
+    def _take_result(result: dict, segments: List[str], confidences: List[float]):
+        """Добавляет текст фразы и уверенность ее слов (SetWords) к накопленным"""
+        text = result.get("text", "").strip()
+        if text:
+            segments.append(text)
+            confidences.extend(word.get("conf", 0.0) for word in result.get("result", []))
+    
+    def decode_pcm(
+        self, pcm: bytes, model_name: Optional[str] = None
+    ) -> Tuple[Optional[str], List[float], bool, float]:
+        """
+        Распознает PCM16 моно 16 кГц распознавателем из пула модели model_name.
+        Возвращает (текст, уверенность по словам, распознаватель взят из пула, время его получения).
+        """
+        started = time.perf_counter()
+        with self.get_pool(model_name).recognizer() as (rec, reused):
+            setup_seconds = time.perf_counter() - started
+            logger.debug("✅ Распознаватель взят из пула: %s, за %.1f мс", reused, setup_seconds * 1000)
+            
+            # Подаем PCM кусками по 4000 фреймов (8000 байт), собирая завершенные фразы
+            segments: List[str] = []
+            confidences: List[float] = []
+            self._feed_recognizer(rec, pcm, segments, confidences)
             
             # Получаем результат
-            print("🎤 Получаю результат распознавания...")
             result = json.loads(rec.FinalResult())
-            print(f"🎤 Сырой результат: {result}")
-            text = result.get('text', '').strip()
-            print(f"🎤 Извлеченный текст: '{text}'")
-            
-            return text if text else None
+        self._take_result(result, segments, confidences)
+        text = " ".join(segments).strip()
+        return (text if text else None), confidences, reused, setup_seconds
+    
+    def recognize_pcm(self, pcm: bytes, model_name: Optional[str] = None) -> Optional[RecognitionResult]:
+        """Распознает уже декодированный фрагмент PCM16 (часть длинной записи)"""
+        try:
+            if not self.model:
+                logger.error("❌ Модель Vosk не инициализирована")
+                return None
+            text, confidences, reused, setup_seconds = self.decode_pcm(pcm, model_name)
+            return RecognitionResult(
+                text=text,
+                duration=len(pcm) / 32000,
+                peak_bytes=len(pcm),
+                recognizer_reused=reused,
+                recognizer_setup_seconds=setup_seconds,
+                model=model_name or self.default_model,
+                confidences=confidences,
+            )
+        except Exception as e:
+            logger.exception("❌ Ошибка при распознавании фрагмента: %s", e)
+            return None
+    
+    def recognize_speech(self, pcm: bytes) -> Optional[str]:
+        """Распознавание речи из PCM16 моно 16 кГц"""
+        try:
+            if not self.model:
+                logger.error("❌ Модель Vosk не инициализирована")
+                return None
+            return self.decode_pcm(pcm)[0]
             
         except Exception as e:
-            print(f"❌ Ошибка при распознавании речи: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка при распознавании речи: %s", e)
             return None
     
     def is_model_ready(self) -> bool:
-        """Проверка готовности модели"""
+        """Проверка готовности модели (в режиме пула процессов — готовности воркеров)"""
+        if self.uses_process_pool():
+            return self._workers_ready
         return self.model is not None
 
 # Создаем глобальный экземпляр процессора
-audio_processor = AudioProcessor() 
\ No newline at end of file
+audio_processor = AudioProcessor()
+
+def _init_worker():
+    """Инициализация процесса-воркера: модель загружается один раз на процесс"""
+    setup_worker_logging()
+    if audio_processor.model is None:
+        # Модель скачивает основной процесс до запуска пула; воркеры только читают ее с диска
+        audio_processor.initialize_model(download=False)
+
+def _warm_up_in_worker() -> float:
+    """Прогрев воркера пробным распознаванием; возвращает его длительность"""
+    if audio_processor.model is None:
+        raise RuntimeError("Модель Vosk не загрузилась в воркере")
+    return audio_processor.warm_up()
+
+def _recognize_in_worker(audio_bytes: bytes, model_name: Optional[str] = None) -> Optional[RecognitionResult]:
+    """Задача для пула процессов: распознавание на модели текущего воркера"""
+    return audio_processor.convert_and_recognize(audio_bytes, model_name) 
+
+def _recognize_pcm_in_worker(pcm: bytes, model_name: Optional[str] = None) -> Optional[RecognitionResult]:
+    """Задача для пула процессов: распознавание одной части длинной записи"""
+    return audio_processor.recognize_pcm(pcm, model_name)
\ No newline at end of file
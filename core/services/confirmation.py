@@ -0,0 +1,171 @@
+"""
+Классификация ответа на шаге подтверждения: сначала локально, затем кэш, затем ИИ
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from settings import CONFIRMATION_CACHE_SIZE, CONFIRMATION_CACHE_TTL_SECONDS
+from core.services.ai import classify_confirmation, classify_and_update_summary
+from core.utils.messages import POSITIVE_ANSWERS, NEGATIVE_ANSWERS
+
+logger = logging.getLogger(__name__)
+
+# Эмодзи, которые однозначно означают ответ (остальные эмодзи отбрасываются при нормализации)
+POSITIVE_EMOJI = ("👍", "👌", "✅", "✔", "🆗", "🙆")
+NEGATIVE_EMOJI = ("👎", "❌", "✖", "🙅", "⛔", "🚫")
+
+# Ответ из одних этих слов — согласие/отказ; хотя бы одно слово должно быть «сильным»
+POSITIVE_WORDS = {
+    "да", "ага", "угу", "верно", "правильно", "конечно", "точно", "подтверждаю", "согласен", "согласна",
+    "ок", "окей", "ok", "okay", "yes", "yep", "дада", "так",
+}
+NEGATIVE_WORDS = {
+    "нет", "неа", "неверно", "неправильно", "нетак", "нето", "ошибка", "исправить", "изменить",
+    "исправьте", "измените", "no", "nope",
+}
+# Слова, которые сами по себе ничего не решают, но не мешают однозначному ответу
+FILLER_WORDS = {"все", "всё", "вроде", "именно", "абсолютно", "совершенно", "полностью", "там", "же", "вот", "это", "уж"}
+WEAK_POSITIVE_WORDS = {"так"}
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_reply(text: str) -> str:
+    """Нижний регистр, ё → е, без пунктуации и эмодзи; «не-а» → «неа», «не верно» → «неверно»"""
+    text = text.lower().replace("ё", "е").replace("-", "")
+    text = _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+    # Частица «не» склеивается со следующим словом, иначе «не верно» выглядело бы как согласие
+    return re.sub(r"\bне (\w+)", r"не\1", text)
+
+
+_POSITIVE_PHRASES = {normalize_reply(answer) for answer in [*POSITIVE_ANSWERS, "всё так", "так и есть"]}
+_NEGATIVE_PHRASES = {normalize_reply(answer) for answer in NEGATIVE_ANSWERS}
+
+
+def local_verdict(text: str) -> Optional[str]:
+    """
+    'YES' / 'NO' для очевидных ответов («да», «всё верно!», «неа», «👍»), None — если ответ
+    неоднозначен или содержит что-то кроме согласия/отказа (тогда решает ИИ)
+    """
+    has_positive_emoji = any(emoji in text for emoji in POSITIVE_EMOJI)
+    has_negative_emoji = any(emoji in text for emoji in NEGATIVE_EMOJI)
+    normalized = normalize_reply(text)
+    if normalized in _POSITIVE_PHRASES and not has_negative_emoji:
+        return "YES"
+    if normalized in _NEGATIVE_PHRASES and not has_positive_emoji:
+        return "NO"
+
+    words = normalized.split()
+    meaningful = [word for word in words if word not in FILLER_WORDS]
+    positive = has_positive_emoji or any(word in POSITIVE_WORDS and word not in WEAK_POSITIVE_WORDS for word in meaningful)
+    negative = has_negative_emoji or any(word in NEGATIVE_WORDS for word in meaningful)
+    if positive == negative:
+        # «да нет», «ну не знаю», пустой ответ
+        return None
+    if not all(word in POSITIVE_WORDS or word in NEGATIVE_WORDS for word in meaningful):
+        # «да, но еще стучит подвеска» — это уточнение
+        return None
+    return "YES" if positive else "NO"
+
+
+class ConfirmationClassifier:
+    def __init__(self, cache_size: int = CONFIRMATION_CACHE_SIZE, ttl: float = CONFIRMATION_CACHE_TTL_SECONDS):
+        """
+        Вердикты ИИ хранятся в LRU-кэше с TTL по нормализованному тексту ответа;
+        одинаковые запросы, выполняющиеся одновременно, ждут один общий вызов
+        """
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self.sources: Dict[str, int] = {}
+
+    def _count(self, source: str):
+        self.sources[source] = self.sources.get(source, 0) + 1
+
+    def _cached(self, key: str) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, label = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return label
+
+    def _remember(self, key: str, label: str):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.ttl, label)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def decides_without_ai(self, text: str) -> bool:
+        """Ответ будет решен локально или из кэша — вызова ИИ не будет"""
+        return local_verdict(text) is not None or self._cached(normalize_reply(text)) is not None
+
+    async def _ask_ai(self, text: str, summary: str, subject: str) -> Tuple[str, Optional[str]]:
+        # Классификация и обновленное резюме одним запросом; если ответ не по схеме — классификатор отдельно
+        decision = await classify_and_update_summary(text, summary, subject=subject)
+        if decision is None:
+            return await classify_confirmation(text), None
+        return decision
+
+    async def classify(self, text: str, summary: str, subject: str = "problem") -> Tuple[str, Optional[str]]:
+        """
+        Возвращает (label, new_summary): label из YES/NO/UNCLEAR, new_summary — обновленное резюме,
+        если ИИ уже составил его для уточнения (иначе None)
+        """
+        label = local_verdict(text)
+        if label is not None:
+            self._count("local")
+            return label, None
+
+        key = normalize_reply(text)
+        label = self._cached(key)
+        if label is not None:
+            self._count("cache")
+            return label, None
+
+        # Для уточнения ответ ИИ зависит и от текущего резюме, поэтому оно входит в ключ общего вызова
+        flight_key = (key, subject, summary)
+        future = self._in_flight.get(flight_key)
+        if future is not None:
+            self._count("shared")
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[flight_key] = future
+        self._count("ai")
+        try:
+            result = await self._ask_ai(text, summary, subject)
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; если их нет — не оставляем его неполученным
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._in_flight.pop(flight_key, None)
+
+        # UNCLEAR не кэшируется: ему нужно резюме под конкретный контекст, а при сбое ИИ это не вердикт
+        if result[0] in ("YES", "NO") and key:
+            self._remember(key, result[0])
+        logger.debug("🤖 Подтверждение классифицировано ИИ: %s", result[0])
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        return {"sources": dict(self.sources), "cache_size": len(self._cache), "in_flight": len(self._in_flight)}
+
+
+# Глобальный классификатор (кэш вердиктов общий для всех пользователей процесса)
+confirmation_classifier = ConfirmationClassifier()
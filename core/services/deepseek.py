@@ -0,0 +1,148 @@
+"""
+Асинхронный клиент DeepSeek API поверх общего пула соединений
+"""
+
+import json
+import logging
+import time
+from typing import AsyncIterator, Optional, List, Dict
+
+import aiohttp
+
+from core.services.http import PooledSession
+from core.services.metrics import DEEPSEEK_CALL_SECONDS
+from core.utils.config import (
+    DEEPSEEK_API_KEY,
+    API_URL,
+    DEEPSEEK_MODEL,
+    DEEPSEEK_TIMEOUT,
+    DEEPSEEK_MAX_CONNECTIONS,
+    DEEPSEEK_MAX_CONNECTIONS_PER_HOST,
+    DEEPSEEK_KEEPALIVE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DeepSeekError(Exception):
+    """Сервис не ответил: ошибка HTTP, сети или таймаут (в отличие от ответа не по схеме)"""
+
+
+class DeepSeekClient:
+    def __init__(self, api_url: str, api_key: str, model: str, session: PooledSession):
+        """Клиент chat/completions; все вызовы разделяют одну keep-alive сессию"""
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.session = session
+
+    def is_configured(self) -> bool:
+        """Проверка, что API ключ задан"""
+        return bool(self.api_key) and self.api_key != "ваш_deepseek_api_key"
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: Optional[float] = None,
+        call: str = "other",
+        **params,
+    ) -> Optional[str]:
+        """
+        Отправляет запрос chat/completions и возвращает текст ответа.
+        Возвращает None, если сервис ответил ошибкой; сетевые ошибки и таймауты пробрасываются.
+        call — тип запроса для метрик задержки.
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            **params,
+        }
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.session.timeout)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self.session.get().post(
+                self.api_url, json=data, headers=self._headers(), timeout=request_timeout
+            ) as response:
+                if response.status >= 400:
+                    logger.warning("❌ DeepSeek API вернул статус %s: %.500s", response.status, await response.text())
+                    return None
+                response_data = await response.json(content_type=None)
+            outcome = "ok"
+        finally:
+            DEEPSEEK_CALL_SECONDS.observe(time.perf_counter() - started, call=call, outcome=outcome)
+        return response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        timeout: Optional[float] = None,
+        call: str = "stream",
+        **params,
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый chat/completions (SSE): отдает фрагменты текста по мере генерации.
+        При ошибке сервиса ничего не отдает; сетевые ошибки и таймауты пробрасываются.
+        В метрики попадает время до первого фрагмента (call + "_first_token") и до конца ответа.
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            **params,
+        }
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.session.timeout)
+        started = time.perf_counter()
+        outcome = "error"
+        first = True
+        try:
+            async with self.session.get().post(
+                self.api_url, json=data, headers=self._headers(), timeout=request_timeout
+            ) as response:
+                if response.status >= 400:
+                    logger.warning("❌ DeepSeek API вернул статус %s: %.500s", response.status, await response.text())
+                    return
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    # Пустые строки и комментарии (": keep-alive") разделяют события SSE
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        if first:
+                            first = False
+                            DEEPSEEK_CALL_SECONDS.observe(
+                                time.perf_counter() - started, call=f"{call}_first_token", outcome="ok"
+                            )
+                        yield delta
+            outcome = "ok"
+        finally:
+            DEEPSEEK_CALL_SECONDS.observe(time.perf_counter() - started, call=call, outcome=outcome)
+
+    async def warmup(self) -> bool:
+        """Заранее открывает соединение с API, чтобы первый диалог не ждал рукопожатия"""
+        return await self.session.warmup(self.api_url)
+
+    async def close(self):
+        await self.session.close()
+
+
+# Создаем глобальный экземпляр клиента
+deepseek_client = DeepSeekClient(
+    api_url=API_URL,
+    api_key=DEEPSEEK_API_KEY,
+    model=DEEPSEEK_MODEL,
+    session=PooledSession(
+        limit=DEEPSEEK_MAX_CONNECTIONS,
+        limit_per_host=DEEPSEEK_MAX_CONNECTIONS_PER_HOST,
+        timeout=DEEPSEEK_TIMEOUT,
+        keepalive_timeout=DEEPSEEK_KEEPALIVE_TIMEOUT,
+    ),
+)
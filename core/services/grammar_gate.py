@@ -0,0 +1,50 @@
+"""
+Политика пропуска исправления грамматики для распознанного голосового текста
+"""
+
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+from settings import ASR_GATE_MAX_WORDS, ASR_GATE_MIN_CONFIDENCE
+from core.services.asr_models import CONFIRMATION_STEP
+
+logger = logging.getLogger(__name__)
+
+
+class CorrectionGate:
+    def __init__(self, max_words: int = ASR_GATE_MAX_WORDS, min_confidence: float = ASR_GATE_MIN_CONFIDENCE):
+        """
+        Политика: на шагах «да/нет» текст идет в классификатор без правки; короткий текст,
+        где каждое слово распознано уверенно, тоже не правится. Остальное — через fix_grammar
+        """
+        self.max_words = max_words
+        self.min_confidence = min_confidence
+        self.decisions: Dict[str, int] = {}
+        self.saved_calls = 0
+
+    def decide(self, text: str, confidences: Sequence[float], step: Optional[str]) -> Tuple[bool, str]:
+        """Возвращает (нужно ли исправлять текст через ИИ, причина решения)"""
+        if step == CONFIRMATION_STEP:
+            correct, reason = False, "yes_no_step"
+        elif not confidences:
+            correct, reason = True, "no_confidence"
+        elif len(text.split()) <= self.max_words and min(confidences) >= self.min_confidence:
+            correct, reason = False, "short_confident"
+        else:
+            correct, reason = True, "needs_correction"
+        key = f"{'correct' if correct else 'skip'}:{reason}"
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+        if not correct:
+            self.saved_calls += 1
+        logger.debug(
+            "🔧 Исправление грамматики: %s (слов %d, мин. уверенность %.2f, сэкономлено вызовов %d)",
+            key, len(text.split()), min(confidences) if confidences else 0, self.saved_calls,
+        )
+        return correct, reason
+
+    def stats(self) -> Dict[str, object]:
+        return {"decisions": dict(self.decisions), "saved_calls": self.saved_calls}
+
+
+# Глобальная политика (счетчики решений общие для процесса)
+correction_gate = CorrectionGate()
@@ -0,0 +1,65 @@
+"""
+Общий пул HTTP-соединений для внешних сервисов
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """Ленивая aiohttp-сессия с keep-alive пулом соединений (одна на процесс)"""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 50,
+        timeout: float = 30,
+        keepalive_timeout: float = 60,
+        headers: Optional[dict] = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.headers = headers or {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def get(self) -> aiohttp.ClientSession:
+        """Возвращает сессию, создавая её при первом обращении (внутри event loop)"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+        return self._session
+
+    async def warmup(self, url: str, timeout: float = 5) -> bool:
+        """
+        Прогревает пул: открывает TCP/TLS соединение с хостом заранее,
+        чтобы первый пользовательский запрос не платил за рукопожатие
+        """
+        try:
+            async with self.get().head(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                await response.read()
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("⚠️ Не удалось прогреть соединение с %s: %s", url, e)
+            return False
+
+    async def close(self):
+        """Закрывает сессию и все соединения пула"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
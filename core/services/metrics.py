@@ -0,0 +1,143 @@
+"""
+Метрики в текстовом формате Prometheus: гистограммы задержек по этапам и сводки сервисов
+"""
+
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин, секунды: от десятков миллисекунд (вызовы API) до минут (длинные голосовые)
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Гистограмма с накопительными корзинами; отдельная серия на каждый набор значений меток"""
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Значения меток -> (счетчики по корзинам, сумма, количество)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        series = self._series.get(key)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            self._series[key] = series
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """with histogram.time(stage="..."): — замеряет блок, в том числе завершившийся исключением"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, totals) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {totals[0]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {int(totals[1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "bot"):
+        """
+        Гистограммы заводятся через histogram(); сводки сервисов (stats() -> dict чисел
+        или вложенных словарей счетчиков) подключаются через register_collector()
+        и отдаются как gauge при каждом запросе
+        """
+        self.prefix = prefix
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        full_name = f"{self.prefix}_{name}"
+        if full_name not in self._histograms:
+            self._histograms[full_name] = Histogram(full_name, documentation, labels, buckets)
+        return self._histograms[full_name]
+
+    def register_collector(self, name: str, collect: Callable[[], Dict[str, Any]]):
+        self._collectors.append((name, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in self._histograms.values():
+            lines.extend(histogram.render())
+        for name, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning("⚠️ Не удалось собрать метрики %s: %s", name, e)
+                continue
+            for key, value in values.items():
+                metric = f"{self.prefix}_{name}_{key}"
+                if isinstance(value, dict):
+                    # Счетчики решений вида {"модель:причина": n} — одна серия на ключ
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.extend(
+                        f'{metric}{{key="{label}"}} {_format_value(count)}' for label, count in sorted(value.items())
+                    )
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
+
+# Этапы распознавания голосового: скачивание, декодирование, ресемплинг, VAD, распознавание
+ASR_STAGE_SECONDS = metrics.histogram(
+    "asr_stage_seconds", "Длительность этапов обработки голосового сообщения", labels=("stage",)
+)
+# Вызовы DeepSeek по типам запросов
+DEEPSEEK_CALL_SECONDS = metrics.histogram(
+    "deepseek_call_seconds", "Длительность запросов к DeepSeek", labels=("call", "outcome")
+)
+# Отправка рекламаций на вебхук (одиночная или пачкой)
+WEBHOOK_DELIVERY_SECONDS = metrics.histogram(
+    "webhook_delivery_seconds", "Длительность отправки на вебхук", labels=("mode", "status")
+)
+# Полная обработка апдейта: от входа в диспетчер до завершения ответа
+UPDATE_SECONDS = metrics.histogram(
+    "update_seconds", "Время обработки апдейта от получения до ответа", labels=("kind", "step", "outcome")
+)
+
+
+def observe_timings(histogram: Histogram, timings: Optional[Dict[str, float]], label: str = "stage"):
+    """Переносит замеры, собранные в другом процессе или потоке, в гистограмму"""
+    for stage, seconds in (timings or {}).items():
+        histogram.observe(seconds, **{label: stage})
@@ -0,0 +1,59 @@
+"""
+HTTP-эндпоинты наблюдаемости: /metrics (Prometheus), /ready и /health
+"""
+
+from aiohttp import web
+
+from core.services.asr_queue import asr_queue
+from core.services.audio import audio_processor
+from core.services.confirmation import confirmation_classifier
+from core.services.grammar_gate import correction_gate
+from core.services.metrics import metrics
+from core.services.outbox import outbox
+from core.services.scheduler import fair_scheduler
+
+
+def register_collectors(storage=None):
+    """Подключает сводки сервисов к реестру метрик (очереди, занятость, счетчики решений)"""
+    metrics.register_collector("asr", lambda: {
+        "busy": audio_processor.busy,
+        "model_ready": int(audio_processor.is_model_ready()),
+        "startup_failed": int(audio_processor.startup_error is not None),
+        "router_decisions": dict(audio_processor.router.decisions),
+    })
+    metrics.register_collector("asr_startup_seconds", lambda: dict(audio_processor.startup_timings))
+    metrics.register_collector("asr_recognizers", audio_processor.recognizer_stats)
+    metrics.register_collector("asr_vad", audio_processor.vad_stats)
+    metrics.register_collector("asr_queue", asr_queue.stats)
+    metrics.register_collector("grammar_gate", correction_gate.stats)
+    metrics.register_collector("confirmation", confirmation_classifier.stats)
+    metrics.register_collector("fair_scheduler", fair_scheduler.stats)
+    metrics.register_collector("outbox", outbox.stats)
+    if storage is not None and hasattr(storage, "stats"):
+        metrics.register_collector("fsm_storage", storage.stats)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def ready_handler(request: web.Request) -> web.Response:
+    """Готовность принимать голосовые: модель загружена и прогрета (текст обслуживается и без нее)"""
+    if audio_processor.is_model_ready():
+        return web.json_response({"ready": True})
+    if audio_processor.startup_error is not None:
+        return web.json_response(
+            {"ready": False, "reason": "asr_startup_failed", "error": audio_processor.startup_error}, status=503
+        )
+    return web.json_response({"ready": False, "reason": "asr_model_loading"}, status=503)
+
+
+async def health_handler(request: web.Request) -> web.Response:
+    return web.json_response({"ok": True})
+
+
+def setup_monitoring(app: web.Application, storage=None):
+    register_collectors(storage)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/ready", ready_handler)
+    app.router.add_get("/health", health_handler)
@@ -0,0 +1,250 @@
+"""
+Надежная доставка рекламаций: локальная очередь на SQLite и фоновая отправка на вебхук
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from settings import (
+    OUTBOX_PATH,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_RETRY_MAX_SECONDS,
+    OUTBOX_CONCURRENCY,
+    WEBHOOK_BATCH_SIZE,
+    WEBHOOK_BATCH_WINDOW_SECONDS,
+)
+from core.services.webhook import build_webhook_payload, post_to_webhook, post_batch_to_webhook
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых имеет смысл повторить отправку (0 — ответа не было)
+RETRYABLE_STATUSES = {0, 408, 425, 429}
+
+
+def is_retryable(status: int) -> bool:
+    return status in RETRYABLE_STATUSES or status >= 500
+
+
+class Outbox:
+    def __init__(
+        self,
+        path: str,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        base_delay: float = OUTBOX_RETRY_BASE_SECONDS,
+        max_delay: float = OUTBOX_RETRY_MAX_SECONDS,
+        concurrency: int = OUTBOX_CONCURRENCY,
+        batch_size: int = WEBHOOK_BATCH_SIZE,
+        batch_window: float = WEBHOOK_BATCH_WINDOW_SECONDS,
+    ):
+        """
+        Рекламация сначала фиксируется на диске, затем фоновая задача доставляет её на вебхук
+        с экспоненциальными повторами; после max_attempts или отказа 4xx запись уходит в dead_letters.
+        При batch_size > 1 готовые записи копятся до batch_size штук или batch_window секунд
+        и уходят одним запросом, результат разбирается по каждой записи
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        # Размеры таблиц для метрик: считаются один раз при открытии базы и дальше ведутся в памяти,
+        # чтобы опрос /metrics не выполнял запросы к SQLite в event loop
+        self.pending = 0
+        self.dead_letters = 0
+
+    def _db(self) -> sqlite3.Connection:
+        """Открывает базу при первом обращении"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Рекламация считается принятой только после fsync
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, idempotency_key TEXT UNIQUE NOT NULL, "
+                "payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+                "next_attempt_at REAL NOT NULL, created_at REAL NOT NULL, last_error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_letters ("
+                "id INTEGER PRIMARY KEY, idempotency_key TEXT UNIQUE NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL, created_at REAL NOT NULL, failed_at REAL NOT NULL, last_error TEXT)"
+            )
+            self.pending = conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            self.dead_letters = conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._db_lock:
+            return self._db().execute(sql, params).fetchall()
+
+    async def enqueue(self, client_data: Dict[str, Any]) -> str:
+        """Сохраняет рекламацию в очередь и будит отправителя; возвращает ключ идемпотентности"""
+        key = str(uuid.uuid4())
+        payload = json.dumps(build_webhook_payload(client_data), ensure_ascii=False)
+        await asyncio.to_thread(self._insert, key, payload, time.time())
+        logger.info("📥 Рекламация %s поставлена в очередь отправки", key)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return key
+
+    def _insert(self, key: str, payload: str, now: float):
+        with self._db_lock:
+            self._db().execute(
+                "INSERT INTO outbox (idempotency_key, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self.pending += 1
+
+    def start(self) -> asyncio.Task:
+        """Запускает фоновую отправку (вызывается в on_startup)"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        """Останавливает отправку; недоставленное останется в базе до следующего запуска"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
+
+    @property
+    def batching(self) -> bool:
+        return self.batch_size > 1
+
+    async def _run(self):
+        while True:
+            # Сбрасываем до выборки, чтобы не пропустить запись, добавленную во время отправки
+            self._wakeup.clear()
+            try:
+                limit = self.batch_size if self.batching else self.concurrency
+                due = await asyncio.to_thread(
+                    self._execute,
+                    "SELECT id, idempotency_key, payload, attempts, created_at, next_attempt_at FROM outbox "
+                    "WHERE next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                    (time.time(), limit),
+                )
+                # Неполную пачку придерживаем, пока самая старая запись ждет меньше batch_window
+                hold = self.batch_window - (time.time() - due[0][5]) if due and self.batching else 0
+                if due and (len(due) >= limit or hold <= 0):
+                    rows = [row[:5] for row in due]
+                    if self.batching:
+                        await self._deliver_batch(rows)
+                    else:
+                        await asyncio.gather(*(self._deliver(*row) for row in rows))
+                    continue
+                wait = hold if due else await asyncio.to_thread(self._seconds_until_next)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("❌ Ошибка очереди отправки рекламаций: %s", e)
+                wait = self.base_delay
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _seconds_until_next(self) -> Optional[float]:
+        row = self._execute("SELECT MIN(next_attempt_at) FROM outbox")
+        if not row or row[0][0] is None:
+            return None
+        return max(0.0, row[0][0] - time.time())
+
+    def retry_delay(self, attempts: int) -> float:
+        """Экспоненциальная задержка с джиттером, чтобы повторы после сбоя не шли одной волной"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _deliver(self, row_id: int, key: str, payload: str, attempts: int, created_at: float):
+        status = await post_to_webhook(json.loads(payload), key)
+        await asyncio.to_thread(self._record_attempt, row_id, key, payload, attempts + 1, created_at, status)
+
+    async def _deliver_batch(self, rows: List[tuple]):
+        records = [(key, json.loads(payload)) for _, key, payload, _, _ in rows]
+        results = await post_batch_to_webhook(records)
+        self.batches += 1
+        for row_id, key, payload, attempts, created_at in rows:
+            await asyncio.to_thread(
+                self._record_attempt, row_id, key, payload, attempts + 1, created_at, results.get(key, 0)
+            )
+
+    def _record_attempt(self, row_id: int, key: str, payload: str, attempts: int, created_at: float, status: int):
+        if 200 <= status < 300:
+            with self._db_lock:
+                self._db().execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self.pending -= 1
+                self.delivered += 1
+            logger.info("✅ Рекламация %s доставлена (попытка %d)", key, attempts)
+            return
+        error = f"HTTP {status}" if status else "нет ответа"
+        if is_retryable(status) and attempts < self.max_attempts:
+            delay = self.retry_delay(attempts)
+            self._execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, error, row_id),
+            )
+            self.retried += 1
+            logger.warning("🔁 Рекламация %s: %s, повтор через %.0f с (попытка %d)", key, error, delay, attempts)
+            return
+        with self._db_lock:
+            conn = self._db()
+            with conn:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters "
+                    "(idempotency_key, payload, attempts, created_at, failed_at, last_error) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, payload, attempts, created_at, time.time(), error),
+                )
+                conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            self.pending -= 1
+            self.dead_letters += 1
+            self.dead += 1
+        logger.error("☠️ Рекламация %s не доставлена (%s, попыток: %d), перенесена в dead_letters", key, error, attempts)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики в памяти, без обращения к базе (до ее открытия размеры таблиц — нули)"""
+        return {
+            "pending": self.pending,
+            "dead_letters": self.dead_letters,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "batches": self.batches,
+        }
+
+
+# Глобальная очередь отправки рекламаций
+outbox = Outbox(OUTBOX_PATH)
@@ -0,0 +1,85 @@
+"""
+Пул переиспользуемых распознавателей Vosk (KaldiRecognizer)
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+import vosk
+
+
+class RecognizerPool:
+    def __init__(self, model, sample_rate: int = 16000, size: int = 4):
+        """Ограниченный пул распознавателей одной модели; между использованиями они сбрасываются"""
+        self.model = model
+        self.sample_rate = sample_rate
+        self.size = size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.constructed = 0
+        self.construct_seconds = 0.0
+
+    def _create(self):
+        started = time.perf_counter()
+        rec = vosk.KaldiRecognizer(self.model, self.sample_rate)
+        # Пословные результаты с уверенностью (conf) — по ним решается, нужна ли правка текста
+        rec.SetWords(True)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.constructed += 1
+            self.construct_seconds += elapsed
+        return rec
+
+    def prefill(self, count: int):
+        """Заранее создает распознаватели, чтобы первые сообщения не платили за построение"""
+        for _ in range(min(count, self.size)):
+            rec = self._create()
+            with self._lock:
+                self._idle.append(rec)
+
+    def acquire(self) -> Tuple[object, bool]:
+        """Берет свободный распознаватель или создает новый при промахе; возвращает (rec, взят_из_пула)"""
+        with self._lock:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop(), True
+            self.misses += 1
+        return self._create(), False
+
+    def release(self, rec):
+        """Сбрасывает распознаватель и возвращает его в пул (лишние выбрасываются)"""
+        rec.Reset()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(rec)
+            else:
+                self.discarded += 1
+
+    @contextmanager
+    def recognizer(self) -> Iterator[Tuple[object, bool]]:
+        """with pool.recognizer() as (rec, reused): ... — распознаватель вернется в пул при выходе"""
+        rec, reused = self.acquire()
+        try:
+            yield rec, reused
+        finally:
+            self.release(rec)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "idle": len(self._idle),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "construct_seconds_total": self.construct_seconds,
+                "construct_seconds_avg": self.construct_seconds / self.constructed if self.constructed else 0.0,
+            }
@@ -0,0 +1,250 @@
+"""
+Справедливое распределение дорогих операций (распознавание речи, вызовы ИИ) между пользователями
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from settings import (
+    FAIR_MAX_CONCURRENT,
+    FAIR_MAX_PENDING_PER_USER,
+    FAIR_ASR_SECONDS_PER_MINUTE,
+    FAIR_ASR_BURST_SECONDS,
+    FAIR_LLM_CALLS_PER_MINUTE,
+    FAIR_LLM_BURST_CALLS,
+)
+
+# Как часто забываются ведра пользователей, которые простаивают и снова полны, секунды
+BUCKET_SWEEP_SECONDS = 60.0
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """Ведро токенов: пополняется со скоростью rate в секунду, вмещает не больше capacity"""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """
+        Через сколько секунд операцию стоимостью cost можно допустить. Операция дороже capacity
+        допускается при полном ведре и уводит его в минус — следующие подождут дольше
+        """
+        self._refill(now)
+        need = min(cost, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens -= cost
+
+    def give_back(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class Ticket:
+    """Заявка пользователя на дорогую операцию"""
+    asr_seconds: float
+    llm_calls: float
+    granted: asyncio.Future
+    # False — заявка тратит только токены пользователя и не занимает место из max_concurrent
+    holds_slot: bool = True
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = FAIR_MAX_CONCURRENT,
+        max_pending_per_user: int = FAIR_MAX_PENDING_PER_USER,
+        asr_per_minute: float = FAIR_ASR_SECONDS_PER_MINUTE,
+        asr_burst: float = FAIR_ASR_BURST_SECONDS,
+        llm_per_minute: float = FAIR_LLM_CALLS_PER_MINUTE,
+        llm_burst: float = FAIR_LLM_BURST_CALLS,
+    ):
+        """
+        Не больше max_concurrent дорогих операций одновременно. У каждого пользователя свои ведра
+        секунд распознавания и вызовов ИИ; свободные места раздаются по кругу между пользователями,
+        поэтому один активный чат не отнимает очередь у остальных
+        """
+        self.max_concurrent = max_concurrent
+        self.max_pending_per_user = max_pending_per_user
+        self.asr_rate = asr_per_minute / 60
+        self.asr_burst = asr_burst
+        self.llm_rate = llm_per_minute / 60
+        self.llm_burst = llm_burst
+        self.in_flight = 0
+        self._queues: "OrderedDict[int, Deque[Ticket]]" = OrderedDict()
+        self._buckets: Dict[int, Dict[str, TokenBucket]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._swept = time.monotonic()
+        self.admitted = 0
+        self.rejected = 0
+        self.delayed = 0
+        self.refunded = 0
+        self.wait_seconds = 0.0
+
+    def _user_buckets(self, user_id: int) -> Dict[str, TokenBucket]:
+        buckets = self._buckets.get(user_id)
+        if buckets is None:
+            buckets = {
+                "asr": TokenBucket(self.asr_rate, self.asr_burst),
+                "llm": TokenBucket(self.llm_rate, self.llm_burst),
+            }
+            self._buckets[user_id] = buckets
+        return buckets
+
+    def _ticket_wait(self, user_id: int, ticket: Ticket, now: float) -> float:
+        buckets = self._user_buckets(user_id)
+        return max(
+            buckets["asr"].wait_time(ticket.asr_seconds, now) if ticket.asr_seconds else 0.0,
+            buckets["llm"].wait_time(ticket.llm_calls, now) if ticket.llm_calls else 0.0,
+        )
+
+    def _sweep(self, now: float):
+        """Забывает ведра пользователей без заявок, если они снова полны — новые ведра будут такими же"""
+        self._swept = now
+        for user_id, buckets in list(self._buckets.items()):
+            if user_id not in self._queues and all(bucket.is_full(now) for bucket in buckets.values()):
+                del self._buckets[user_id]
+
+    def _dispatch(self):
+        """Раздает свободные места по кругу: пользователю с готовой заявкой — одно место за проход"""
+        self._timer = None
+        now = time.monotonic()
+        if now - self._swept >= BUCKET_SWEEP_SECONDS:
+            self._sweep(now)
+        next_ready = None
+        while self._queues:
+            progressed = False
+            for user_id in list(self._queues):
+                queue = self._queues[user_id]
+                while queue and queue[0].granted.done():
+                    # Заявку отменили (например, обработка апдейта прервана)
+                    queue.popleft()
+                if not queue:
+                    del self._queues[user_id]
+                    continue
+                if queue[0].holds_slot and self.in_flight >= self.max_concurrent:
+                    continue
+                wait = self._ticket_wait(user_id, queue[0], now)
+                if wait > 0:
+                    next_ready = wait if next_ready is None else min(next_ready, wait)
+                    continue
+                ticket = queue.popleft()
+                buckets = self._user_buckets(user_id)
+                buckets["asr"].take(ticket.asr_seconds, now)
+                buckets["llm"].take(ticket.llm_calls, now)
+                if ticket.holds_slot:
+                    self.in_flight += 1
+                self.admitted += 1
+                self.wait_seconds += now - ticket.enqueued
+                ticket.granted.set_result(None)
+                # Пользователь уходит в конец круга
+                self._queues.move_to_end(user_id)
+                if not queue:
+                    del self._queues[user_id]
+                progressed = True
+            if not progressed:
+                break
+        if self._queues and next_ready is not None:
+            self._timer = asyncio.get_running_loop().call_later(next_ready, self._dispatch)
+
+    def _release(self, user_id: int, holds_slot: bool = True):
+        if holds_slot:
+            self.in_flight -= 1
+        # Пользователь, чья операция только что завершилась, пропускает вперед тех, кто встал в очередь за это время
+        if user_id in self._queues:
+            self._queues.move_to_end(user_id)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def pending(self, user_id: int) -> int:
+        return len(self._queues.get(user_id, ()))
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        user_id: int,
+        asr_seconds: float = 0.0,
+        llm_calls: float = 0.0,
+        hold_slot: bool = True,
+    ) -> AsyncIterator[bool]:
+        """
+        async with scheduler.admit(user_id, ...) as admitted: — ждет своей очереди.
+        admitted = False, если у пользователя уже слишком много ожидающих заявок.
+        hold_slot=False — ждать только токенов пользователя, не занимая общее место
+        (у распознавания свой ограничитель одновременных задач — очередь ASR)
+        """
+        if self.pending(user_id) >= self.max_pending_per_user:
+            self.rejected += 1
+            yield False
+            return
+        ticket = Ticket(asr_seconds, llm_calls, asyncio.get_running_loop().create_future(), hold_slot)
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+        if not ticket.granted.done():
+            self.delayed += 1
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                # Место уже выдано, но обработка отменена — возвращаем его
+                self._release(user_id, hold_slot)
+            raise
+        try:
+            yield True
+        finally:
+            self._release(user_id, hold_slot)
+
+    def refund(self, user_id: int, asr_seconds: float = 0.0, llm_calls: float = 0.0):
+        """Возвращает пользователю токены операции, которая так и не выполнилась"""
+        buckets = self._buckets.get(user_id)
+        if buckets is None:
+            return
+        now = time.monotonic()
+        buckets["asr"].give_back(asr_seconds, now)
+        buckets["llm"].give_back(llm_calls, now)
+        self.refunded += 1
+
+    async def charge(self, user_id: int, asr_seconds: float = 0.0, llm_calls: float = 0.0) -> bool:
+        """Ждет токенов пользователя и списывает их, не занимая места; False — слишком много ожидающих заявок"""
+        async with self.admit(user_id, asr_seconds, llm_calls, hold_slot=False) as admitted:
+            return admitted
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "waiting_users": len(self._queues),
+            "tracked_users": len(self._buckets),
+            "admitted": self.admitted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "refunded": self.refunded,
+            "wait_seconds_avg": self.wait_seconds / self.admitted if self.admitted else 0.0,
+        }
+
+
+# Глобальный планировщик дорогих операций
+fair_scheduler = FairScheduler()
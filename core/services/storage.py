@@ -0,0 +1,229 @@
+"""
+Постоянное хранилище FSM на SQLite (WAL) с кэшем в памяти и объединением записей
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterable, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from settings import FSM_CACHE_MAX_KEYS
+
+
+class _Batch:
+    """Изменения одного batch(): ключ → измененные поля записи; попадают в кэш и базу только при выходе"""
+
+    def __init__(self):
+        self.changes: Dict[str, Dict[str, Any]] = {}
+        self.open = True
+
+
+# Текущий batch() задачи (свой у каждого апдейта), None — изменения пишутся сразу
+_current_batch: ContextVar[Optional[_Batch]] = ContextVar("fsm_batch", default=None)
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, max_cached: int = FSM_CACHE_MAX_KEYS):
+        """
+        Хранилище состояний и данных диалогов. Чтения обслуживаются из LRU-кэша (write-through) на
+        max_cached ключей, промахи читаются из файла в отдельном потоке; изменения внутри batch()
+        копятся и фиксируются одной транзакцией при выходе
+        """
+        self.path = path
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Ключи, которые не удалось записать: повторяются при следующем flush()
+        self._unsaved: Set[str] = set()
+        # Ключи, которые сейчас записываются: их нельзя вытеснять
+        self._pins: Dict[str, int] = {}
+        self._db_lock = threading.Lock()
+        self._conn = self._connect()
+        self.commits = 0
+        self.rows_written = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет целостность при сбое, а fsync делается только на чекпоинте
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}')"
+        )
+        return conn
+
+    def _read(self, key: str):
+        with self._db_lock:
+            return self._conn.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+
+    async def _load(self, key: str) -> Dict[str, Any]:
+        """Возвращает запись из кэша, при промахе — читает ее из базы, не блокируя цикл событий"""
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        self.misses += 1
+        row = await asyncio.to_thread(self._read, key)
+        # Пока шло чтение, запись могла попасть в кэш из параллельного промаха — она не старее прочитанной
+        record = self._cache.get(key)
+        if record is None:
+            record = {"state": row[0], "data": json.loads(row[1])} if row else {"state": None, "data": {}}
+            self._cache[key] = record
+            self._evict(keep=key)
+        return record
+
+    def _evict(self, keep: Optional[str] = None):
+        """Вытесняет давно не использованные записи сверх max_cached, кроме еще не записанных и keep"""
+        excess = len(self._cache) - self.max_cached
+        if excess <= 0:
+            return
+        victims = []
+        for key in self._cache:
+            if len(victims) >= excess:
+                break
+            if key != keep and key not in self._unsaved and key not in self._pins:
+                victims.append(key)
+        for key in victims:
+            del self._cache[key]
+
+    def _pin(self, keys: Iterable[str]):
+        for key in keys:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _unpin(self, keys: Iterable[str]):
+        for key in keys:
+            count = self._pins.pop(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+
+    async def _set(self, key: str, field: str, value: Any):
+        batch = _current_batch.get()
+        if batch is not None and batch.open:
+            # До выхода из batch() изменение видит только этот апдейт
+            batch.changes.setdefault(key, {})[field] = value
+            return
+        # Вне batch() или в задаче, пережившей свой batch(), — пишем сразу
+        (await self._load(key))[field] = value
+        await self.flush([key])
+
+    async def _get(self, key: str, field: str) -> Any:
+        batch = _current_batch.get()
+        if batch is not None and batch.open:
+            changes = batch.changes.get(key)
+            if changes is not None and field in changes:
+                return changes[field]
+        return (await self._load(key))[field]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._set(self.key_builder.build(key), "state", state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get(self.key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._set(self.key_builder.build(key), "data", dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get(self.key_builder.build(key), "data")).copy()
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator[None]:
+        """
+        Откладывает запись изменений до выхода из блока — одна транзакция на обработку апдейта.
+        Пока блок открыт, его изменения видит только он сам: параллельные апдейты (и их записи в базу)
+        видят последнее зафиксированное состояние, даже для того же ключа. При выходе измененные поля
+        (state и/или data) переносятся в кэш; если один ключ меняли два блока, по каждому полю побеждает
+        последний завершившийся
+        """
+        if _current_batch.get() is not None:
+            # Вложенный блок входит во внешний
+            yield
+            return
+        batch = _Batch()
+        token = _current_batch.set(batch)
+        try:
+            yield
+        finally:
+            _current_batch.reset(token)
+            batch.open = False
+            # До записи ключи считаются незаписанными — их не вытеснит из кэша промах другого ключа
+            self._unsaved |= batch.changes.keys()
+            for key, changes in batch.changes.items():
+                (await self._load(key)).update(changes)
+            await self.flush(batch.changes)
+
+    async def flush(self, keys: Iterable[str] = ()):
+        """Записывает изменения keys (и ранее не записанные) одной транзакцией"""
+        keys = set(keys) | self._unsaved
+        if not keys:
+            return
+        self._unsaved = set()
+        self._pin(keys)
+        upserts = []
+        deletes = []
+        for key in keys:
+            record = self._cache.get(key)
+            if record is None or record["state"] is None and not record["data"]:
+                # Пустые записи (после state.clear()) в базе не храним
+                deletes.append((key,))
+            else:
+                upserts.append((key, record["state"], json.dumps(record["data"], ensure_ascii=False)))
+        try:
+            await asyncio.to_thread(self._write, upserts, deletes)
+        except Exception:
+            # Изменения остаются в кэше и будут записаны следующим flush()
+            self._unsaved |= keys
+            raise
+        finally:
+            self._unpin(keys)
+        for (key,) in deletes:
+            record = self._cache.get(key)
+            if record and record["state"] is None and not record["data"]:
+                del self._cache[key]
+        self._evict()
+
+    def _write(self, upserts, deletes):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data",
+                        upserts,
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.commits += 1
+            self.rows_written += len(upserts) + len(deletes)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cached_keys": len(self._cache),
+            "pending_keys": len(self._unsaved),
+            "cache_misses": self.misses,
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+        }
+
+    async def close(self) -> None:
+        await self.flush()
+        with self._db_lock:
+            self._conn.close()
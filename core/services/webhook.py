@@ -1,63 +1,128 @@
-import requests
 import json
+import logging
+import time
+import uuid
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
-from settings import WEBHOOK_URL, WEBHOOK_API_KEY
+import aiohttp
 
+from settings import WEBHOOK_URL, WEBHOOK_API_KEY, WEBHOOK_TIMEOUT, WEBHOOK_BULK_URL
+from core.services.http import PooledSession
+from core.services.metrics import WEBHOOK_DELIVERY_SECONDS
 
-def send_client_data_to_webhook(client_data: Dict[str, Any]) -> bool:
+logger = logging.getLogger(__name__)
+
+# Пул соединений с вебхуком рекламаций (используется фоновой отправкой из outbox)
+webhook_session = PooledSession(limit=20, limit_per_host=10, timeout=WEBHOOK_TIMEOUT)
+
+
+def build_webhook_payload(client_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Формирует данные в формате вебхука"""
+    return {
+        "name": client_data.get("name", ""),
+        "surname": client_data.get("surname", ""),
+        "phone": client_data.get("phone", ""),
+        "problem_description": client_data.get("problem_description", ""),
+        "client_offer": client_data.get("client_offer", ""),
+        "date": client_data.get("date", datetime.now().strftime("%d.%m.%Y %H:%M"))
+    }
+
+
+def build_webhook_headers(idempotency_key: Optional[str] = None) -> Dict[str, str]:
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "User-Agent": "FreshAuto-Bot/1.0"
+    }
+    # Добавляем ключ, если задан
+    if WEBHOOK_API_KEY and WEBHOOK_API_KEY != "your_webhook_api_key_here":
+        headers["Authorization"] = f"Bearer {WEBHOOK_API_KEY}"
+        headers["X-API-Key"] = WEBHOOK_API_KEY
+    # Повторы одной рекламации идут с тем же ключом, чтобы получатель мог отбросить дубликаты
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
+
+
+async def _post(url: str, body: Any, idempotency_key: Optional[str], mode: str = "single") -> Tuple[int, str]:
+    started = time.perf_counter()
+    status, text = 0, ""
+    try:
+        async with webhook_session.get().post(
+            url, json=body, headers=build_webhook_headers(idempotency_key)
+        ) as response:
+            text = await response.text()
+            status = response.status
+            logger.debug("📊 Ответ вебхука %s: %.500s", status, text)
+    except (aiohttp.ClientError, TimeoutError) as e:
+        logger.warning("❌ Исключение при отправке данных на вебхук: %r", e)
+    # Статус в метриках — класс ответа (2xx, 4xx, 5xx) или 0, если ответа не было
+    WEBHOOK_DELIVERY_SECONDS.observe(
+        time.perf_counter() - started, mode=mode, status=f"{status // 100}xx" if status else "0"
+    )
+    return status, text
+
+
+async def post_to_webhook(body: Any, idempotency_key: Optional[str] = None) -> int:
     """
-    Отправляет данные клиента на вебхук (только POST JSON на WEBHOOK_URL).
+    Отправляет JSON на WEBHOOK_URL. Возвращает HTTP-статус ответа, 0 — если ответа нет
+    (сетевая ошибка или таймаут)
     """
+    status, _ = await _post(WEBHOOK_URL, body, idempotency_key)
+    return status
+
+
+async def post_batch_to_webhook(records: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+    """
+    Отправляет несколько рекламаций одним POST с JSON-массивом на WEBHOOK_BULK_URL.
+    Каждая запись дополняется полем idempotency_key. Ожидаемый ответ — массив (или {"results": [...]})
+    объектов {"idempotency_key": ..., "status": <HTTP-код записи>}; записи без результата
+    считаются недоставленными (статус 0). Возвращает {ключ: статус}.
+    """
+    keys = [key for key, _ in records]
+    body = [{**payload, "idempotency_key": key} for key, payload in records]
+    # Ключ пачки зависит от состава, поэтому повтор той же пачки получатель тоже распознает
+    batch_key = "batch-" + uuid.uuid5(uuid.NAMESPACE_URL, ",".join(keys)).hex
+    logger.info("📤 Отправляю на вебхук пачку из %d рекламаций", len(records))
+    status, text = await _post(WEBHOOK_BULK_URL, body, batch_key, mode="batch")
+    if not 200 <= status < 300:
+        # Пачка не принята целиком: каждая запись повторяется по своему расписанию
+        return {key: status for key in keys}
+
     try:
-        # Формируем данные в нужном формате
-        payload = {
-            "name": client_data.get("name", ""),
-            "surname": client_data.get("surname", ""),
-            "phone": client_data.get("phone", ""),
-            "problem_description": client_data.get("problem_description", ""),
-            "client_offer": client_data.get("client_offer", ""),
-            "date": client_data.get("date", datetime.now().strftime("%d.%m.%Y %H:%M"))
-        }
-
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "User-Agent": "FreshAuto-Bot/1.0"
-        }
-        # Добавляем ключ, если задан
-        if WEBHOOK_API_KEY and WEBHOOK_API_KEY != "your_webhook_api_key_here":
-            headers["Authorization"] = f"Bearer {WEBHOOK_API_KEY}"
-            headers["X-API-Key"] = WEBHOOK_API_KEY
-
-        print("📤 Отправляю данные на вебхук (POST JSON)...")
-        print(f"🌐 URL: {WEBHOOK_URL}")
-        print(f"📋 JSON данные: {json.dumps(payload, ensure_ascii=False, indent=2)}")
-
-        response = requests.post(
-            WEBHOOK_URL,
-            json=payload,
-            headers=headers,
-            timeout=15
-        )
-
-        print(f"📊 Статус ответа: {response.status_code}")
-        try:
-            print(f"📝 Ответ: {response.json()}")
-        except Exception:
-            print(f"📝 Ответ (текст): {response.text}")
-
-        if response.status_code in (200, 201, 202):
-            print("✅ Данные успешно отправлены на вебхук")
-            return True
-
-        print("❌ Ошибка отправки данных на вебхук")
-        return False
-
-    except Exception as e:
-        print(f"❌ Исключение при отправке данных на вебхук: {e}")
-        return False
+        parsed = json.loads(text) if text else None
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results")
+    if not isinstance(parsed, list):
+        # Получатель не вернул результаты по записям — принятая пачка считается доставленной целиком
+        return {key: status for key in keys}
+
+    results = {key: 0 for key in keys}
+    for item in parsed:
+        if isinstance(item, dict) and item.get("idempotency_key") in results:
+            item_status = item.get("status")
+            if isinstance(item_status, int):
+                results[item["idempotency_key"]] = item_status
+            elif "ok" in item:
+                results[item["idempotency_key"]] = 200 if item["ok"] else 0
+    return results
+
+
+async def send_client_data_to_webhook(client_data: Dict[str, Any], idempotency_key: Optional[str] = None) -> bool:
+    """
+    Отправляет данные клиента на вебхук (только POST JSON на WEBHOOK_URL).
+    """
+    payload = build_webhook_payload(client_data)
+    status = await post_to_webhook(payload, idempotency_key)
+    if status in (200, 201, 202):
+        logger.info("✅ Данные успешно отправлены на вебхук")
+        return True
+
+    logger.warning("❌ Ошибка отправки данных на вебхук: статус %s", status)
+    return False
 
 
 def format_client_data_for_webhook(
@@ -81,4 +146,4 @@ def format_client_data_for_webhook(
         "problem_description": problem_description,
         "client_offer": client_offer,
         "date": datetime.now().strftime("%d.%m.%Y %H:%M")
-    } 
\ No newline at end of file
+    }
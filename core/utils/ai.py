@@ -1,25 +1,7 @@
-import requests
-from core.utils.prompt import SYSTEM_PROMPT
-from core.utils.config import DEEPSEEK_API_KEY, API_URL, DEEPSEEK_MODEL
 import re
 
-def ask_ai(user_message: str, history=None) -> str:
-    if history is None:
-        history = []
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        *history,
-        {"role": "user", "content": user_message}
-    ]
-    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-    data = {
-        "model": DEEPSEEK_MODEL,
-        "messages": messages
-    }
-    response = requests.post(API_URL, json=data, headers=headers)
-    if response.ok:
-        return response.json().get("choices", [{}])[0].get("message", {}).get("content", "Нет ответа от нейросети.")
-    return "Ошибка при обращении к ИИ-сервису."
+# ask_ai живет в core.services.ai (асинхронный клиент DeepSeek); оставляем импорт для обратной совместимости
+from core.services.ai import ask_ai
 
 def validate_phone(phone: str) -> bool:
     """
@@ -1,6 +1,15 @@
 import os
 from dotenv import load_dotenv
 from settings import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, DEEPSEEK_MODEL
+from settings import (
+    DEEPSEEK_TIMEOUT,
+    DEEPSEEK_CLASSIFY_TIMEOUT,
+    DEEPSEEK_MAX_CONNECTIONS,
+    DEEPSEEK_MAX_CONNECTIONS_PER_HOST,
+    DEEPSEEK_KEEPALIVE_TIMEOUT,
+    DEEPSEEK_STREAMING,
+    DEEPSEEK_STREAM_EDIT_INTERVAL,
+)
 
 # Для обратной совместимости
 API_URL = DEEPSEEK_API_URL
@@ -0,0 +1,140 @@
+"""
+Неблокирующее логирование: записи уходят в очередь, в файлы и stdout их пишет фоновый поток
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Optional
+
+from settings import (
+    LOG_LEVEL,
+    LOG_DIR,
+    LOG_FILE_MAX_MB,
+    LOG_FILE_BACKUPS,
+    LOG_CONSOLE,
+    LOG_DEBUG_SAMPLE_RATE,
+)
+
+# Атрибуты LogRecord, которые не считаются пользовательскими полями extra
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# Очередь без ограничения: поток-писатель разгребает ее быстрее, чем обработчики сообщений наполняют
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись — одна строка JSON; поля из extra= добавляются как есть,
+    исключение — объектом exc_info (тип, текст, трассировка)
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            exc_type, exc_value, _ = record.exc_info
+            entry["exc_info"] = {
+                "type": exc_type.__name__ if exc_type else None,
+                "message": str(exc_value),
+                "traceback": self.formatException(record.exc_info),
+            }
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    def __init__(self, rate: float):
+        """Пропускает долю rate записей уровня DEBUG; записи INFO и выше проходят всегда"""
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Стандартный prepare форматирует запись целиком в потоке вызова и убирает exc_info.
+        Здесь в потоке вызова только подставляются аргументы в msg (они могут измениться, пока запись
+        ждет в очереди); exc_info и stack_info остаются на записи, и трассировку форматирует
+        обработчик потока-писателя — JsonFormatter кладет ее в поле exc_info
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, log_dir: str = LOG_DIR) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер: QueueHandler с выборкой DEBUG-событий в вызывающем коде,
+    ротируемый JSON-файл log_dir/bot.jsonl и (если LOG_CONSOLE) stdout — в фоновом потоке
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    handlers = []
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, "bot.jsonl"),
+        maxBytes=LOG_FILE_MAX_MB * 1024 * 1024,
+        backupCount=LOG_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers.append(file_handler)
+    if LOG_CONSOLE:
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handlers.append(console)
+    
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    # Библиотеки на DEBUG слишком многословны даже с выборкой
+    for noisy in ("aiogram.event", "aiohttp.access"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.INFO))
+    
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def setup_worker_logging(level: str = LOG_LEVEL):
+    """
+    Логирование в процессах пула распознавания: в общий ротируемый файл несколько процессов
+    писать не могут, поэтому воркеры пишут JSON в stderr (его собирает docker logs)
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи (вызывается при остановке)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -54,6 +54,33 @@ SOLUTION_CONFIRMATION_UPDATE_TEMPLATE = (
     "Спасибо за уточнение. Теперь я зафиксировал так: {summary}. Всё ли верно?"
 )
 
+# Заготовка сообщения, в которое по мере генерации выводится резюме
+SUMMARY_PLACEHOLDER = "⏳ Формулирую резюме…"
+
+# Ответ, когда у пользователя слишком много необработанных сообщений
+TOO_MANY_REQUESTS_MESSAGE = (
+    "⏳ Вы отправили несколько сообщений подряд, я ещё обрабатываю предыдущие. "
+    "Пожалуйста, дождитесь ответа."
+)
+
+# Очередь распознавания голосовых сообщений
+VOICE_QUEUE_POSITION_TEMPLATE = "⏳ Голосовых сообщений сейчас много. Вы {position}-й в очереди на распознавание…"
+VOICE_QUEUE_FULL_MESSAGE = (
+    "😔 Сейчас очень много голосовых сообщений. Пожалуйста, повторите через минуту "
+    "или напишите ответ текстом."
+)
+VOICE_TOO_LONG_TEMPLATE = (
+    "🎤 Голосовое сообщение слишком длинное (максимум {limit} мин). "
+    "Пожалуйста, запишите короче или напишите текстом."
+)
+
+# Ответ, когда ИИ-сервис не ответил (шаг диалога не меняется, можно повторить)
+AI_UNAVAILABLE_MESSAGE = "😔 Не удалось обработать ответ: ИИ-сервис сейчас недоступен. Пожалуйста, повторите через минуту."
+
+# Голосовые, пока распознавание запускается и если его запуск не удался
+VOICE_MODEL_LOADING_MESSAGE = "🔄 Модель распознавания речи еще загружается. Попробуйте через несколько секунд."
+VOICE_UNAVAILABLE_MESSAGE = "😔 Распознавание голосовых сейчас недоступно. Пожалуйста, напишите ответ текстом."
+
 # Сообщения подтверждения
 CONFIRMATION_PROMPT = "Пожалуйста, ответьте **Да** или **Нет**.\n\nВсё верно с указанными данными?"
 
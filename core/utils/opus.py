@@ -0,0 +1,178 @@
+"""
+Декодирование голосовых сообщений Telegram (Ogg/Opus) напрямую в 16 кГц через libopus.
+libopus умеет декодировать сразу в 8/12/16/24/48 кГц, поэтому отдельный ресемплинг не нужен.
+"""
+
+import ctypes
+import ctypes.util
+import struct
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+SUPPORTED_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Максимальный кадр Opus — 120 мс; на 48 кГц это 5760 отсчетов
+MAX_FRAME_SAMPLES = 5760
+
+_libopus = None
+_libopus_checked = False
+
+
+def load_libopus():
+    """Загружает libopus через ctypes; возвращает None, если библиотека недоступна"""
+    global _libopus, _libopus_checked
+    if _libopus_checked:
+        return _libopus
+    _libopus_checked = True
+    path = ctypes.util.find_library("opus") or "libopus.so.0"
+    try:
+        lib = ctypes.CDLL(path)
+    except OSError:
+        return None
+    lib.opus_decoder_create.argtypes = [ctypes.c_int32, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+    lib.opus_decoder_create.restype = ctypes.c_void_p
+    lib.opus_decode.argtypes = [
+        ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int32,
+        ctypes.POINTER(ctypes.c_int16), ctypes.c_int, ctypes.c_int,
+    ]
+    lib.opus_decode.restype = ctypes.c_int
+    lib.opus_decoder_destroy.argtypes = [ctypes.c_void_p]
+    lib.opus_decoder_destroy.restype = None
+    _libopus = lib
+    return _libopus
+
+
+def is_ogg_opus(data: bytes) -> bool:
+    """Быстрая проверка сигнатуры: первая страница Ogg с пакетом OpusHead"""
+    return data[:4] == b"OggS" and b"OpusHead" in data[:128]
+
+
+def iter_ogg_packets(data: bytes) -> Iterator[Tuple[bytes, int, bool]]:
+    """
+    Разбирает поток Ogg и отдает пакеты первого логического потока.
+    Для каждого пакета возвращает (пакет, granule страницы, признак последней страницы);
+    granule указывается только у последнего пакета, завершившегося на странице, у остальных -1.
+    """
+    offset = 0
+    serial = None
+    pending = b""
+    while offset + 27 <= len(data):
+        if data[offset:offset + 4] != b"OggS":
+            raise ValueError("Поврежденный поток Ogg")
+        header_type = data[offset + 5]
+        granule, page_serial = struct.unpack_from("<qI", data, offset + 6)
+        segments = data[offset + 26]
+        lacing = data[offset + 27:offset + 27 + segments]
+        body = offset + 27 + segments
+        offset = body + sum(lacing)
+        if serial is None:
+            serial = page_serial
+        if page_serial != serial:
+            continue
+
+        is_last_page = bool(header_type & 0x04)
+        packets = []
+        start = body
+        length = 0
+        for lace in lacing:
+            length += lace
+            if lace < 255:
+                packets.append(pending + data[start:start + length])
+                pending = b""
+                start += length
+                length = 0
+        # Незавершенный пакет продолжится на следующей странице
+        if length:
+            pending += data[start:start + length]
+
+        for index, packet in enumerate(packets):
+            is_final = index == len(packets) - 1
+            yield packet, granule if is_final else -1, is_last_page and is_final
+
+
+def ogg_opus_duration(data: bytes) -> float:
+    """Длительность Ogg/Opus в секундах по granule последней страницы (минус pre-skip), без декодирования"""
+    packets = iter_ogg_packets(data)
+    head, _, _ = next(packets, (b"", -1, False))
+    if not head.startswith(b"OpusHead") or len(head) < 19:
+        raise ValueError("Нет заголовка OpusHead")
+    pre_skip = struct.unpack_from("<H", head, 10)[0]
+    last_granule = 0
+    for _, granule, _ in packets:
+        if granule >= 0:
+            last_granule = granule
+    return max(0, last_granule - pre_skip) / 48000
+
+
+def iter_opus_pcm(data: bytes, sample_rate: int = 16000) -> Iterator[np.ndarray]:
+    """
+    Декодирует Ogg/Opus в моно PCM16 на частоте sample_rate, отдавая блоки по мере разбора страниц.
+    Учитывает pre-skip, выходное усиление и обрезку по granule последней страницы.
+    """
+    if sample_rate not in SUPPORTED_RATES:
+        raise ValueError(f"libopus не декодирует в {sample_rate} Гц")
+    lib = load_libopus()
+    if lib is None:
+        raise RuntimeError("libopus недоступна")
+
+    packets = iter_ogg_packets(data)
+    head, _, _ = next(packets, (b"", -1, False))
+    if not head.startswith(b"OpusHead") or len(head) < 19:
+        raise ValueError("Нет заголовка OpusHead")
+    pre_skip, _, gain_q8, mapping_family = struct.unpack_from("<HIhB", head, 10)
+    if mapping_family != 0:
+        raise ValueError("Многопоточные Opus-потоки не поддерживаются")
+    next(packets, None)  # OpusTags
+
+    error = ctypes.c_int()
+    decoder = lib.opus_decoder_create(sample_rate, 1, ctypes.byref(error))
+    if error.value != 0 or not decoder:
+        raise RuntimeError(f"opus_decoder_create вернул ошибку {error.value}")
+
+    scale = sample_rate / 48000  # granule и pre-skip всегда в отсчетах 48 кГц
+    gain = 10 ** (gain_q8 / (256 * 20)) if gain_q8 else None
+    to_skip = int(round(pre_skip * scale))
+    emitted = 0
+    buffer = np.empty(MAX_FRAME_SAMPLES, dtype=np.int16)
+    out_ptr = buffer.ctypes.data_as(ctypes.POINTER(ctypes.c_int16))
+    try:
+        chunk = []
+        for packet, granule, is_last in packets:
+            samples = lib.opus_decode(decoder, packet, len(packet), out_ptr, MAX_FRAME_SAMPLES, 0)
+            if samples < 0:
+                raise RuntimeError(f"opus_decode вернул ошибку {samples}")
+            pcm = buffer[:samples]
+            if to_skip:
+                skipped = min(to_skip, len(pcm))
+                pcm = pcm[skipped:]
+                to_skip -= skipped
+            if is_last and granule >= 0:
+                # Последняя страница может содержать дополнение до целого кадра
+                total = max(0, int(round((granule - pre_skip) * scale)))
+                pcm = pcm[:max(0, total - emitted)]
+            emitted += len(pcm)
+            chunk.append(pcm.copy())
+            if granule >= 0 and chunk:
+                yield _apply_gain(np.concatenate(chunk), gain)
+                chunk = []
+        if chunk:
+            yield _apply_gain(np.concatenate(chunk), gain)
+    finally:
+        lib.opus_decoder_destroy(decoder)
+
+
+def decode_ogg_opus(data: bytes, sample_rate: int = 16000) -> Optional[np.ndarray]:
+    """Декодирует весь Ogg/Opus в моно PCM16; None, если libopus недоступна или поток не Opus"""
+    if not is_ogg_opus(data) or load_libopus() is None:
+        return None
+    chunks = list(iter_opus_pcm(data, sample_rate))
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks)
+
+
+def _apply_gain(pcm: np.ndarray, gain: Optional[float]) -> np.ndarray:
+    if gain is None:
+        return pcm
+    return np.clip(pcm * gain, -32768, 32767).astype(np.int16)
@@ -0,0 +1,72 @@
+"""
+Постепенное обновление сообщения в Telegram (потоковый текст с ограничением частоты правок)
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottledEditor:
+    def __init__(self, message: Message, interval: float = 1.0):
+        """Правит message не чаще раза в interval секунд; первая правка выполняется сразу"""
+        self.message = message
+        self.interval = interval
+        self.text = message.text or ""
+        self._last_edit = 0.0
+        self.edits = 0
+
+    async def _edit(self, text: str):
+        if text == self.text:
+            return
+        try:
+            await self.message.edit_text(text)
+            self.text = text
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать: пропускаем промежуточное обновление
+            logger.warning("⚠️ Частые правки сообщения, Telegram просит подождать %s с", e.retry_after)
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобное для промежуточного текста не критичны
+            logger.warning("⚠️ Не удалось обновить сообщение: %s", e)
+        self._last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        """Промежуточный текст: пропускается, если с прошлой правки прошло меньше interval"""
+        if time.monotonic() - self._last_edit >= self.interval:
+            await self._edit(text)
+
+    async def finish(self, text: str):
+        """
+        Итоговый текст: применяется всегда. При RetryAfter правка повторяется после паузы;
+        если сообщение так и не обновилось, итог отправляется новым сообщением
+        """
+        if text == self.text:
+            return
+        for attempt in range(2):
+            try:
+                await self.message.edit_text(text)
+                self.text = text
+                self.edits += 1
+                return
+            except TelegramRetryAfter as e:
+                logger.warning("⚠️ Итоговая правка отложена Telegram на %s с", e.retry_after)
+                if attempt:
+                    break
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                logger.warning("⚠️ Не удалось обновить сообщение итоговым текстом: %s", e)
+                break
+        # Пользователь должен увидеть итог, прежде чем его попросят подтвердить
+        try:
+            self.message = await self.message.answer(text)
+        except TelegramBadRequest as e:
+            # Обработчик должен дойти до смены шага диалога, даже если итог отправить не удалось
+            logger.error("❌ Не удалось отправить итоговый текст: %s", e)
+            return
+        self.text = text
@@ -32,4 +32,27 @@ CONFIRMATION_CLASSIFIER_PROMPT = (
     "- NO — если пользователь отрицает/просит исправить\n"
     "- UNCLEAR — если непонятно (вопрос, уточнение, иное)\n"
     "Ответь строго одним словом: YES, NO или UNCLEAR."
-) 
\ No newline at end of file
+)
+
+# Системный промпт для совмещенной классификации подтверждения и обновления резюме (ответ — JSON)
+CONFIRMATION_WITH_SUMMARY_PROMPT = (
+    "Ты — классификатор ответа подтверждения и редактор резюме.\n"
+    "Тебе дают текущее {subject} клиента и ответ клиента на вопрос, верно ли оно.\n"
+    "Классифицируй ответ на один из трёх классов:\n"
+    "- YES — если клиент подтверждает корректность\n"
+    "- NO — если клиент отрицает/просит исправить\n"
+    "- UNCLEAR — если это уточнение, дополнение или иное\n"
+    "Для UNCLEAR обнови резюме с учётом уточнения: кратко, словами клиента, с обращением \"Вы\", "
+    "одним предложением, без лишних символов в конце. Для YES и NO резюме не нужно.\n"
+    "Ответь строго JSON-объектом без пояснений: {{\"label\": \"YES\" | \"NO\" | \"UNCLEAR\", \"summary\": строка или null}}"
+)
+
+# Системный промпт для голосового ввода: исправление распознанного текста и резюме одним запросом (ответ — JSON)
+VOICE_FIX_AND_SUMMARY_PROMPT = (
+    "Ты — редактор распознанной речи клиента и составитель резюме.\n"
+    "1. Исправь грамматические ошибки в тексте: только падежи, спряжения, согласования и склонения; "
+    "НЕ меняй смысл, содержание и структуру, сохраняй разговорный стиль, не добавляй лишних слов.\n"
+    "2. По исправленному тексту составь {subject}: кратко (1-2 предложения), ключевыми словами клиента, "
+    "с обращением \"Вы\" вместо \"он/она/ему\", без лишней информации и без лишних символов в конце.\n"
+    "Ответь строго JSON-объектом без пояснений: {{\"text\": исправленный текст, \"summary\": резюме}}"
+)
@@ -0,0 +1,71 @@
+"""
+Векторизованный полифазный ресемплер (замена librosa.resample для конвейера Vosk)
+"""
+
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Сколько выходных отсчетов считается одной матричной операцией (ограничивает временную память)
+BLOCK_ROWS = 16384
+
+# Полуширина фильтра в периодах максимальной из частот up/down (как в scipy.signal.resample_poly)
+HALF_WIDTH = 10
+
+
+@lru_cache(maxsize=16)
+def design_filter(up: int, down: int, beta: float = 5.0) -> np.ndarray:
+    """
+    Проектирует ФНЧ (окно Кайзера) и раскладывает его на полифазные компоненты.
+    Возвращает матрицу (up, taps): строка p — фаза p, коэффициенты уже развернуты для свертки.
+    """
+    max_rate = max(up, down)
+    half_len = HALF_WIDTH * max_rate
+    n = np.arange(-half_len, half_len + 1, dtype=np.float64)
+    cutoff = 1.0 / max_rate
+    h = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), beta)
+    h *= up / h.sum()  # единичное усиление на постоянной составляющей
+
+    taps = -(-len(h) // up)
+    padded = np.zeros(taps * up, dtype=np.float64)
+    padded[:len(h)] = h
+    # phases[p, k] = h[p + k * up], разворачиваем по k, чтобы считать скалярным произведением окна входа
+    phases = padded.reshape(taps, up).T[:, ::-1]
+    return np.ascontiguousarray(phases, dtype=np.float32)
+
+
+def resample_poly(x: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Меняет частоту дискретизации моно-сигнала orig_sr -> target_sr, возвращает float32"""
+    x = np.asarray(x, dtype=np.float32)
+    if orig_sr == target_sr:
+        return x
+    divisor = gcd(orig_sr, target_sr)
+    up, down = target_sr // divisor, orig_sr // divisor
+    phases = design_filter(up, down)
+    taps = phases.shape[1]
+    half_len = HALF_WIDTH * max(up, down)
+
+    n_out = -(-len(x) * up // down)
+    if n_out == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    # Выход n берет фазу (n*down + half_len) % up и окно входа, заканчивающееся на (n*down + half_len) // up
+    last_base = ((n_out - 1) * down + half_len) // up
+    padded = np.zeros(taps - 1 + max(len(x), last_base + 1), dtype=np.float32)
+    padded[taps - 1:taps - 1 + len(x)] = x
+    windows = sliding_window_view(padded, taps)
+
+    y = np.empty(n_out, dtype=np.float32)
+    # При взаимно простых up/down фаза повторяется с периодом up, а начало окна растет на down
+    for j in range(min(up, n_out)):
+        t = j * down + half_len
+        phase, base = t % up, t // up
+        count = len(range(j, n_out, up))
+        out = y[j::up]
+        for start in range(0, count, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, count)
+            rows = windows[base + start * down:base + (stop - 1) * down + 1:down]
+            out[start:stop] = rows @ phases[phase]
+    return y
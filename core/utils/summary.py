@@ -2,9 +2,27 @@
 Утилиты для создания резюме проблемы с помощью AI
 """
 
-from core.services.ai import ask_ai
+from typing import Awaitable, Callable, Optional
 
-def create_problem_summary(topic: str, details: str) -> str:
+from core.services.ai import ask_ai, stream_ai
+from core.utils.config import DEEPSEEK_STREAMING
+
+async def generate_summary(prompt: str, on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+    """
+    Запрашивает резюме у ИИ. Если передан on_partial и потоковый режим включен,
+    текст приходит по частям; при сбое потока запрос повторяется обычным способом
+    """
+    if on_partial is not None and DEEPSEEK_STREAMING:
+        summary = await stream_ai(prompt, on_partial)
+        if summary is not None:
+            return summary
+    return await ask_ai(prompt, [], skip_offtopic_check=True)
+
+def clean_summary(summary: str) -> str:
+    """Очищает резюме от лишних символов в конце"""
+    return summary.strip().rstrip('?.!')
+
+async def create_problem_summary(topic: str, details: str, on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
     """
     Создает резюме проблемы на основе темы и деталей
     """
@@ -32,15 +50,15 @@ def create_problem_summary(topic: str, details: str) -> str:
     """
     
     try:
-        summary = ask_ai(prompt, [], skip_offtopic_check=True)
+        summary = await generate_summary(prompt, on_partial)
         # Очищаем резюме от лишних символов
-        cleaned_summary = summary.strip().rstrip('?.!')
+        cleaned_summary = clean_summary(summary)
         return cleaned_summary
     except Exception as e:
         # Fallback - простое резюме
         return f"{topic}: {details[:100]}{'...' if len(details) > 100 else ''}"
 
-def update_problem_summary(original_summary: str, correction: str) -> str:
+async def update_problem_summary(original_summary: str, correction: str) -> str:
     """
     Обновляет резюме проблемы на основе уточнения клиента
     """
@@ -63,15 +81,15 @@ def update_problem_summary(original_summary: str, correction: str) -> str:
     """
     
     try:
-        summary = ask_ai(prompt, [], skip_offtopic_check=True)
+        summary = await generate_summary(prompt)
         # Очищаем резюме от лишних символов
-        cleaned_summary = summary.strip().rstrip('?.!')
+        cleaned_summary = clean_summary(summary)
         return cleaned_summary
     except Exception as e:
         # Fallback - простое обновление
         return f"{original_summary} (уточнение: {correction[:50]})"
 
-def create_solution_summary(solution: str) -> str:
+async def create_solution_summary(solution: str, on_partial: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
     """
     Создает резюме предложения решения
     """
@@ -96,15 +114,15 @@ def create_solution_summary(solution: str) -> str:
     """
     
     try:
-        summary = ask_ai(prompt, [], skip_offtopic_check=True)
+        summary = await generate_summary(prompt, on_partial)
         # Очищаем резюме от лишних символов
-        cleaned_summary = summary.strip().rstrip('?.!')
+        cleaned_summary = clean_summary(summary)
         return cleaned_summary
     except Exception as e:
         # Fallback - простое резюме
         return f"{solution[:100]}{'...' if len(solution) > 100 else ''}"
 
-def update_solution_summary(original_summary: str, correction: str) -> str:
+async def update_solution_summary(original_summary: str, correction: str) -> str:
     """
     Обновляет резюме предложения решения на основе уточнения клиента
     """
@@ -127,9 +145,9 @@ def update_solution_summary(original_summary: str, correction: str) -> str:
     """
     
     try:
-        summary = ask_ai(prompt, [], skip_offtopic_check=True)
+        summary = await generate_summary(prompt)
         # Очищаем резюме от лишних символов
-        cleaned_summary = summary.strip().rstrip('?.!')
+        cleaned_summary = clean_summary(summary)
         return cleaned_summary
     except Exception as e:
         # Fallback - простое обновление
@@ -16,4 +16,131 @@ DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-coder")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://webhooks.freshauto.ru/handle_reclamation")
 
 # API ключ для вебхука (если нужен)
-WEBHOOK_API_KEY = os.getenv("WEBHOOK_API_KEY", "your_webhook_api_key_here")
\ No newline at end of file
+WEBHOOK_API_KEY = os.getenv("WEBHOOK_API_KEY", "your_webhook_api_key_here")
+
+# Параметры HTTP-клиента DeepSeek (общий пул keep-alive соединений на процесс)
+DEEPSEEK_TIMEOUT = float(os.getenv("DEEPSEEK_TIMEOUT", "30"))
+DEEPSEEK_CLASSIFY_TIMEOUT = float(os.getenv("DEEPSEEK_CLASSIFY_TIMEOUT", "10"))
+DEEPSEEK_MAX_CONNECTIONS = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS", "100"))
+DEEPSEEK_MAX_CONNECTIONS_PER_HOST = int(os.getenv("DEEPSEEK_MAX_CONNECTIONS_PER_HOST", "50"))
+DEEPSEEK_KEEPALIVE_TIMEOUT = float(os.getenv("DEEPSEEK_KEEPALIVE_TIMEOUT", "60"))
+# Потоковый вывод резюме в сообщение по мере генерации (1 — включено)
+DEEPSEEK_STREAMING = os.getenv("DEEPSEEK_STREAMING", "1") == "1"
+# Как часто обновлять сообщение с генерируемым текстом, секунды
+DEEPSEEK_STREAM_EDIT_INTERVAL = float(os.getenv("DEEPSEEK_STREAM_EDIT_INTERVAL", "1.0"))
+
+# Распознавание речи: количество процессов-воркеров Vosk (0 — распознавание в потоке основного процесса)
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", str(os.cpu_count() or 1)))
+# Максимальная длительность голосового сообщения, секунды (ограничивает память одной задачи)
+ASR_MAX_AUDIO_SECONDS = float(os.getenv("ASR_MAX_AUDIO_SECONDS", "600"))
+# Потоковое распознавание с промежуточным текстом (1 — включено). Идет в потоках основного процесса,
+# поэтому при включении пул процессов ASR_WORKERS не используется
+ASR_STREAMING = os.getenv("ASR_STREAMING", "0") == "1"
+# Как часто обновлять сообщение с промежуточным текстом, секунды
+ASR_PARTIAL_INTERVAL = float(os.getenv("ASR_PARTIAL_INTERVAL", "1.0"))
+# Прерывать распознавание, если за первые N секунд аудио речь не найдена (0 — не прерывать)
+ASR_EMPTY_ABORT_SECONDS = float(os.getenv("ASR_EMPTY_ABORT_SECONDS", "8"))
+# Пул распознавателей Vosk на процесс: максимальный размер и сколько создать заранее
+ASR_RECOGNIZER_POOL_SIZE = int(os.getenv("ASR_RECOGNIZER_POOL_SIZE", "4"))
+ASR_RECOGNIZER_PREFILL = int(os.getenv("ASR_RECOGNIZER_PREFILL", "1"))
+# Реестр моделей Vosk: "имя=путь;имя=путь". Модель по умолчанию — быстрая (скачивается при первом запуске)
+ASR_MODELS = os.getenv("ASR_MODELS", "small=vosk-model-small-ru")
+ASR_DEFAULT_MODEL = os.getenv("ASR_DEFAULT_MODEL", "small")
+# Точная модель для длинных описаний — только по явной настройке, ее каталог нужно положить самостоятельно
+# (например, ASR_MODELS="small=vosk-model-small-ru;large=vosk-model-ru" и ASR_ACCURATE_MODEL=large); пусто — не используется
+ASR_ACCURATE_MODEL = os.getenv("ASR_ACCURATE_MODEL", "")
+# Аудио не длиннее этого (секунды) всегда распознается моделью по умолчанию
+ASR_SHORT_AUDIO_SECONDS = float(os.getenv("ASR_SHORT_AUDIO_SECONDS", "5"))
+# Точная модель используется, только пока в очереди распознавания ждут меньше стольких голосовых
+ASR_ACCURATE_MAX_QUEUED = int(os.getenv("ASR_ACCURATE_MAX_QUEUED", "1"))
+# Записи от этой длительности (секунды) делятся по паузам и распознаются параллельно
+ASR_SEGMENT_MIN_SECONDS = float(os.getenv("ASR_SEGMENT_MIN_SECONDS", "40"))
+# Минимальная длительность одной части при параллельном распознавании, секунды
+ASR_SEGMENT_SECONDS = float(os.getenv("ASR_SEGMENT_SECONDS", "20"))
+# Вырезать тишину перед распознаванием ("0" — отключить)
+ASR_VAD = os.getenv("ASR_VAD", "1") == "1"
+# Абсолютный нижний порог энергии речи, dBFS
+ASR_VAD_FLOOR_DB = float(os.getenv("ASR_VAD_FLOOR_DB", "-50"))
+# Порог энергии речи не поднимается выше этого уровня даже для шумных записей, dBFS
+ASR_VAD_CEILING_DB = float(os.getenv("ASR_VAD_CEILING_DB", "-35"))
+# Насколько речь должна быть громче уровня шума записи, дБ
+ASR_VAD_MARGIN_DB = float(os.getenv("ASR_VAD_MARGIN_DB", "12"))
+# Меньше этого количества речи в записи — считаем ее тишиной, секунды
+ASR_VAD_MIN_SPEECH_SECONDS = float(os.getenv("ASR_VAD_MIN_SPEECH_SECONDS", "0.3"))
+# Паузы длиннее этого сжимаются до этой длины, секунды
+ASR_VAD_MAX_PAUSE_SECONDS = float(os.getenv("ASR_VAD_MAX_PAUSE_SECONDS", "0.6"))
+# Запас тишины вокруг речи, чтобы не срезать края слов, секунды
+ASR_VAD_PADDING_SECONDS = float(os.getenv("ASR_VAD_PADDING_SECONDS", "0.2"))
+# Очередь распознавания: предел задач в очереди и в работе (сверх него голосовые отклоняются)
+ASR_QUEUE_MAX_JOBS = int(os.getenv("ASR_QUEUE_MAX_JOBS", "64"))
+# Сколько голосовых распознается одновременно
+ASR_QUEUE_MAX_RUNNING = int(os.getenv("ASR_QUEUE_MAX_RUNNING", str(max(1, ASR_WORKERS))))
+# Бюджет одновременно распознаваемого аудио, секунды, и оценки памяти на эти задачи, МБ
+ASR_QUEUE_AUDIO_SECONDS_BUDGET = float(os.getenv("ASR_QUEUE_AUDIO_SECONDS_BUDGET", "900"))
+ASR_QUEUE_MEMORY_BUDGET_MB = int(os.getenv("ASR_QUEUE_MEMORY_BUDGET_MB", "512"))
+# Распознанный текст не длиннее стольких слов с уверенностью каждого не ниже порога не правится через ИИ
+ASR_GATE_MAX_WORDS = int(os.getenv("ASR_GATE_MAX_WORDS", "6"))
+ASR_GATE_MIN_CONFIDENCE = float(os.getenv("ASR_GATE_MIN_CONFIDENCE", "0.9"))
+
+# Кэш вердиктов ИИ для неоднозначных ответов на шагах подтверждения: размер (0 — без кэша) и время жизни, секунды
+CONFIRMATION_CACHE_SIZE = int(os.getenv("CONFIRMATION_CACHE_SIZE", "1024"))
+CONFIRMATION_CACHE_TTL_SECONDS = float(os.getenv("CONFIRMATION_CACHE_TTL_SECONDS", "3600"))
+
+# Файл SQLite для состояний диалогов (переживает перезапуск бота)
+FSM_STORAGE_PATH = os.getenv("FSM_STORAGE_PATH", "data/fsm.sqlite3")
+# Сколько диалогов держать в кэше хранилища (давно не активные читаются из файла заново)
+FSM_CACHE_MAX_KEYS = int(os.getenv("FSM_CACHE_MAX_KEYS", "10000"))
+
+# Справедливая очередь дорогих операций: сколько выполняется одновременно на процесс
+# (голосовые тратят только лимиты пользователя, одновременное распознавание ограничивает ASR_QUEUE_*)
+FAIR_MAX_CONCURRENT = int(os.getenv("FAIR_MAX_CONCURRENT", "16"))
+# Сколько необработанных дорогих сообщений может ждать у одного пользователя (остальные отклоняются)
+FAIR_MAX_PENDING_PER_USER = int(os.getenv("FAIR_MAX_PENDING_PER_USER", "5"))
+# Лимиты на пользователя: секунды распознавания и вызовы ИИ в минуту, а также запас на всплеск
+FAIR_ASR_SECONDS_PER_MINUTE = float(os.getenv("FAIR_ASR_SECONDS_PER_MINUTE", "120"))
+FAIR_ASR_BURST_SECONDS = float(os.getenv("FAIR_ASR_BURST_SECONDS", "180"))
+FAIR_LLM_CALLS_PER_MINUTE = float(os.getenv("FAIR_LLM_CALLS_PER_MINUTE", "12"))
+FAIR_LLM_BURST_CALLS = float(os.getenv("FAIR_LLM_BURST_CALLS", "5"))
+
+# Режим получения апдейтов: "polling" (по умолчанию) или "webhook".
+# Webhook тоже рассчитан на один инстанс: состояния диалогов (FSM_STORAGE_PATH) — локальный файл SQLite,
+# лимиты FAIR_*, очередь распознавания и outbox — свои у каждого процесса. Несколько инстансов за
+# балансировщиком разнесли бы сообщения одного диалога по разным состояниям
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес, на который Telegram будет присылать апдейты в режиме webhook (без пути)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (пустой — случайный при каждом запуске)
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+# HTTP-сервер с /metrics, /ready и /health в режиме polling (в режиме webhook он работает всегда)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Адрес HTTP-сервера бота (порт 8000 открыт в Dockerfile)
+WEB_SERVER_HOST = os.getenv("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = int(os.getenv("WEB_SERVER_PORT", "8000"))
+
+# Доставка рекламаций на вебхук: таймаут запроса и локальная очередь с повторами
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "15"))
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "data/outbox.sqlite3")
+# После стольких неудачных попыток рекламация переносится в dead_letters
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12"))
+# Задержка перед повтором растет вдвое с каждой попыткой: от базовой до максимальной, секунды
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "5"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "1800"))
+# Сколько рекламаций отправляется одновременно
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+# Пакетная отправка: до WEBHOOK_BATCH_SIZE рекламаций одним POST с JSON-массивом (1 — по одной)
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "1"))
+# Сколько секунд ждать, пока пачка наберется, после появления первой готовой записи
+WEBHOOK_BATCH_WINDOW_SECONDS = float(os.getenv("WEBHOOK_BATCH_WINDOW_SECONDS", "2"))
+# Адрес приема пачек (по умолчанию тот же вебхук)
+WEBHOOK_BULK_URL = os.getenv("WEBHOOK_BULK_URL", WEBHOOK_URL)
+
+# Логирование: уровень, каталог ротируемых JSON-логов (смонтирован как ./logs) и размер файлов
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FILE_MAX_MB = int(os.getenv("LOG_FILE_MAX_MB", "20"))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+# Дублировать логи в stdout (через ту же фоновую очередь)
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1") == "1"
+# Доля DEBUG-событий, которые попадают в лог (отладочные события пишутся на каждое сообщение)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.05"))